@@ -11,7 +11,6 @@ import utils as ut
 import networkx as nx
 from math import ceil
 from wordcloud import WordCloud, ImageColorGenerator
-import collections
 from PIL import Image
 
 np.random.seed(42)
@@ -26,6 +25,7 @@ FPH, FW = ut.load_fph()
 UCN, UW = ut.load_ucn()
 SN, SW = ut.load_sn()
 IFG, IRG, Mappings = ut.load_basic_graphs()
+IFG, IRG = ut.NeighborIndex(IFG), ut.NeighborIndex(IRG)
 IIds = [NI.GetId() for NI in UCN.Nodes()]
 iid_to_ingredient = Mappings['IID_to_Ingredient_Mapping']
 ingredient_to_iid = {ingredient:iid for iid, ingredient in iid_to_ingredient.iteritems()}
@@ -52,12 +52,9 @@ def hist_degree_distribution(G, name):
     plt.show()
     
 def weighted_hist_degree_distribution(G, W, name):
-    iid_to_weight = collections.defaultdict(int)
-    for Edge, Weight in W.iteritems():
-        iid_to_weight[Edge[0]] += Weight
-        iid_to_weight[Edge[1]] += Weight
+    IIds, Degrees = W.weighted_degrees()
     filename = '../analysis/' + name + '_WeightedDegDistrHist'
-    Histogram = [weight for iid, weight in iid_to_weight.iteritems()]
+    Histogram = Degrees.tolist()
     plt.xlabel('Node Degree')
     plt.ylabel('Number of Nodes with a Given Degree')
     plt.hist(Histogram)
@@ -96,7 +93,8 @@ def print_top_w(W, K, iid_to_ingredient, name=None, Reverse=True):
     print '\\textbf{Ingredient 1} & \\textbf{Ingredient 2} & \\textbf{Score}\\\\ \hline'
     
     
-    OrderedWeights = sorted([(Weight, Edge) for Edge, Weight in W.iteritems()                                      if Edge[0] in iid_to_ingredient and Edge[1] in iid_to_ingredient],                                             reverse=Reverse)[:K]
+    AIIds, BIIds, Weights = W.top_edges(K, iid_to_ingredient.keys(), Reverse)
+    OrderedWeights = zip(Weights.tolist(), zip(AIIds.tolist(), BIIds.tolist()))
     for i, (Weight, Edge) in enumerate(OrderedWeights):
         pairing = '{} & {} & {:.3f}\\\\'.format(iid_to_ingredient[Edge[0]], iid_to_ingredient[Edge[1]], Weight)
         if i < len(OrderedWeights) - 1:
@@ -167,12 +165,10 @@ def community_word_cloud(Communities, W, key_ingredient, name):
             Community = C
             break
     # Create dictionary of words to sum of edge weights
-    MinWeight = min([Weight for Edge, Weight in W.iteritems()])
-    PowerDict = collections.defaultdict(int)
-    for IId in Community:
-        for Edge, Weight in W.iteritems():
-            if Edge[0] == IId or Edge[1] == IId:
-                PowerDict[IId] += (Weight - MinWeight)
+    MinWeight = W.Weights.min()
+    IIds, Powers = W.weighted_degrees(-MinWeight)
+    InCommunity = np.in1d(IIds, Community)
+    PowerDict = dict(zip(IIds[InCommunity].tolist(), Powers[InCommunity].tolist()))
     # Create a word list by dividing the power by the min power, taking the ceil, and adding that many words to the list
     WordList = []
     for IId, Power in PowerDict.iteritems():
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+##############################################
+######### Content Addressed Build Cache ######
+##############################################
+
+# Manifest of every stage built so far and of the content hashes of the files they read and wrote
+cache_file = '../data/build_cache.json'
+
+# A stage is identified by a key hashed from its name, its parameters and the contents of its input
+# files (including the outputs of the stages it depends on). A stage is skipped while its key is
+# unchanged and its outputs still have the contents it wrote, so a downstream stage only rebuilds
+# when something it depends on actually changed.
+class BuildCache():
+    def __init__(self, filename=cache_file, Force=False):
+        self.filename = filename
+        self.Force = Force
+        self.Stages, self.Files = {}, {}
+        if os.path.exists(filename):
+            with open(filename) as f:
+                Manifest = json.load(f)
+            self.Stages, self.Files = Manifest['stages'], Manifest['files']
+
+    # sha1 of the contents of a file (rehashed only when its size or modification time changes)
+    def file_hash(self, filename):
+        Stat = os.stat(filename)
+        Entry = self.Files.get(filename)
+        if Entry is not None and Entry[0] == Stat.st_size and Entry[1] == Stat.st_mtime:
+            return Entry[2]
+        Hash = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for Block in iter(lambda: f.read(1 << 20), b''):
+                Hash.update(Block)
+        self.Files[filename] = [Stat.st_size, Stat.st_mtime, Hash.hexdigest()]
+        return Hash.hexdigest()
+
+    # Key of a stage given its input files and (json serializable) parameters
+    def stage_key(self, name, inputs, params=None):
+        Hash = hashlib.sha1(name)
+        Hash.update(json.dumps(params, sort_keys=True))
+        for filename in sorted(inputs):
+            Hash.update(filename)
+            Hash.update(self.file_hash(filename))
+        return Hash.hexdigest()
+
+    # Whether a stage was last built with this key and its outputs have not changed since
+    def is_current(self, name, Key, outputs):
+        Stage = self.Stages.get(name)
+        if self.Force or Stage is None or Stage['key'] != Key: return False
+        return all(os.path.exists(f) and self.file_hash(f) == Stage['outputs'].get(f) for f in outputs)
+
+    # Run build() unless the outputs of the stage are current, returns whether the stage was built
+    def run(self, name, inputs, outputs, build, params=None):
+        Key = self.stage_key(name, inputs, params)
+        if self.is_current(name, Key, outputs):
+            print 'Skipping {} (up to date)'.format(name)
+            return False
+        print 'Building {}...'.format(name)
+        build()
+        self.record(name, inputs, outputs, params)
+        return True
+
+    # Record a stage as built from its current inputs (for stages whose outputs were written outside of run())
+    def record(self, name, inputs, outputs, params=None):
+        self.Stages[name] = {'key': self.stage_key(name, inputs, params), 'params': params,
+                             'outputs': {f: self.file_hash(f) for f in outputs}}
+        self.save()
+
+    # Parameters a stage was last built with (None if they were not recorded)
+    def stage_params(self, name):
+        return self.Stages.get(name, {}).get('params')
+
+    # Drop the record of a stage (so that it is rebuilt next time)
+    def forget(self, name):
+        self.Stages.pop(name, None)
+        self.save()
+
+    def save(self):
+        with open(self.filename, 'w') as f:
+            json.dump({'stages': self.Stages, 'files': self.Files}, f, indent=1, sort_keys=True)
@@ -1,6 +1,5 @@
 import utils as ut
 import numpy as np
-import pickle
 
 # def euclidean_distance(X, Y):
 # 	return np.sqrt(((X - Y) ** 2).sum())
@@ -15,6 +14,10 @@ import pickle
 # 	for i, (d, Ingredient) in enumerate(Ranked):
 # 		print '{}. {} ({})'.format(i, Ingredient, d)
 
+# Text embeddings of a network written by node2vec
+def emb_file(name):
+	return '../node2vec/embeddings/{}.emb'.format(name)
+
 def main():
 	# Get mappings
 	# iid_to_ingredient = ut.load_mappings()['IID_to_Ingredient_Mapping']
@@ -22,17 +25,18 @@ def main():
 	Names = ['ocn', 'fph', 'ucn', 'sn']
 	for name in Names:	
 		Embeddings = []
-		with open('../node2vec/embeddings/{}.emb'.format(name), 'r') as f:
+		with open(emb_file(name), 'r') as f:
 			header = f.readline().strip().split()
 			for line in f:
 				line = line.strip().split()
 				NId, Embedding = int(line[0]), [float(n) for n in line[1:]]
 				Embeddings.append((np.array(Embedding), NId))
 		# print_random_top(Embeddings, iid_to_ingredient)
-		Map = {NId:E for E, NId in Embeddings}
-		filename = '../data/mappings/{}_emb_map.pkl'.format(name)
-		with open(filename, 'wb') as f:
-			pickle.dump(Map, f, pickle.HIGHEST_PROTOCOL)
+		# Save a contiguous float32 matrix with rows sorted by IId and the IId of each row
+		ut.save_embedding_matrix(name, [NId for E, NId in Embeddings], [E for E, NId in Embeddings])
+
+	# Precompute the rows of every cuisine's ingredients in each network's embedding matrix
+	ut.save_cuisine_rows()
 
 
 if __name__ == '__main__':
@@ -1,7 +1,10 @@
 import utils as ut
 
+def edgelist_file(name):
+	return '../data/graphs/{}_edgelist.txt'.format(name)
+
 def convert_to_edgelist(Graph, Weights, name):
-	with open('../data/graphs/{}_edgelist.txt'.format(name), 'w') as out:
+	with open(edgelist_file(name), 'w') as out:
 		for Edge in Graph.Edges():
 			Edge = (Edge.GetSrcNId(), Edge.GetDstNId())
 			line = '{} {} {}\n'.format(Edge[0], Edge[1], Weights[Edge])
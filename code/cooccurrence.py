@@ -0,0 +1,244 @@
+import numpy as np
+import scipy.sparse as sp
+import collections
+
+##############################################
+######### Sparse Incidence Matrices ##########
+##############################################
+
+# Build a sparse (Nodes x Neighbors) 0/1 incidence matrix for the given nodes of a bipartite graph
+def incidence_matrix(G, NIds):
+    Rows, Cols, ColIndex = [], [], {}
+    for Row, NId in enumerate(NIds):
+        for Nbr in G.GetNI(NId).GetOutEdges():
+            Rows.append(Row)
+            Cols.append(ColIndex.setdefault(Nbr, len(ColIndex)))
+    Data = np.ones(len(Rows), dtype=np.int32)
+    return sp.csr_matrix((Data, (Rows, Cols)), shape=(len(NIds), len(ColIndex)))
+
+# Intersection counts for every pair of rows (i < j) sharing at least one column,
+# computed one block of rows at a time so memory stays bounded for large vocabularies.
+# Pairs are returned in row-major order, the same order as the builders' nested pair loops.
+def co_occurrence(A, BlockSize=1024):
+    AT = A.T.tocsc()
+    Rows, Cols, Common = [], [], []
+    for Start in range(0, A.shape[0], BlockSize):
+        # Keep only the strict upper triangle of this block (global column > global row)
+        Block = sp.triu(A[Start:Start+BlockSize].dot(AT), k=Start+1).tocsr()
+        Block.sort_indices()
+        Block = Block.tocoo()
+        Rows.append(Block.row.astype(np.int64) + Start)
+        Cols.append(Block.col.astype(np.int64))
+        Common.append(Block.data)
+    if len(Rows) == 0:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int32)
+    return np.concatenate(Rows), np.concatenate(Cols), np.concatenate(Common)
+
+##############################################
+############ Pairwise Statistics #############
+##############################################
+
+# Shared neighbor counts for all pairs of NIds that have at least one neighbor in common
+# (Rows and Cols index into NIds and Degrees, Common holds the size of each intersection)
+PairCounts = collections.namedtuple('PairCounts', ['NIds', 'Degrees', 'Rows', 'Cols', 'Common'])
+
+# Compute the pair counts of NIds in the bipartite graph G from a single sparse product
+def pair_counts(G, NIds, BlockSize=1024):
+    A = incidence_matrix(G, NIds)
+    Degrees = np.asarray(A.sum(1)).ravel()
+    Rows, Cols, Common = co_occurrence(A, BlockSize)
+    return PairCounts(np.asarray(NIds, dtype=np.int64), Degrees, Rows, Cols, Common)
+
+# Number of unordered pairs of nodes in C
+def num_pairs(C):
+    N = len(C.NIds)
+    return N * (N - 1) // 2
+
+# Look up the intersection counts of C for arbitrary (Row, Col) pairs (0 if the pair shares nothing)
+def lookup(C, Rows, Cols):
+    N = len(C.NIds)
+    Query = np.asarray(Rows, dtype=np.int64) * N + np.asarray(Cols, dtype=np.int64)
+    if len(C.Common) == 0: return np.zeros(len(Query), dtype=C.Common.dtype)
+    # Pairs are stored in row-major order, so their flattened keys are already sorted
+    Keys = C.Rows * N + C.Cols
+    Index = np.minimum(np.searchsorted(Keys, Query), len(Keys) - 1)
+    return np.where(Keys[Index] == Query, C.Common[Index], 0)
+
+# Only the pairs of C with at least one node in Nodes (Rows and Cols still index into all of C.NIds)
+def restrict(C, Nodes):
+    Mask = np.in1d(C.NIds, Nodes)
+    Mask = Mask[C.Rows] | Mask[C.Cols]
+    return C._replace(Rows=C.Rows[Mask], Cols=C.Cols[Mask], Common=C.Common[Mask])
+
+##############################################
+########### Vectorized Pair Metrics ##########
+##############################################
+
+# Vectorized utils.PMI for arrays of common counts and degrees (Note NR = Number of Recipes)
+def PMI(Common, ADeg, BDeg, NR):
+    return np.log(Common) - np.log(ADeg) - np.log(BDeg) + np.log(NR)
+
+# Vectorized utils.JI for arrays of common counts and degrees
+def JI(Common, ADeg, BDeg):
+    return Common.astype(np.float64) / (ADeg + BDeg - Common)
+
+# Jaccard Index of every pair in C (as an array aligned with C.Rows and C.Cols)
+def pair_JI(C):
+    return JI(C.Common, C.Degrees[C.Rows], C.Degrees[C.Cols])
+
+# Jaccard Index of C for arbitrary (Row, Col) pairs (0 if the pair shares nothing)
+def lookup_JI(C, Rows, Cols):
+    Common = lookup(C, Rows, Cols)
+    Union = C.Degrees[Rows] + C.Degrees[Cols] - Common
+    return np.where(Common > 0, Common.astype(np.float64) / np.maximum(Union, 1), 0.0)
+
+# Vectorized utils.FPHF given the flavor and recipe factors of each pair
+def FPHF(FF, RF, MedFF):
+    return RF * ((FF - MedFF) ** 2)
+
+# Vectorized utils.COF given the flavor factor and PMI of each pair
+def COF(FF, PMIScore, MedFF):
+    return PMIScore + np.sqrt(((FF - MedFF) ** 2))
+
+# Vectorized utils.SF given the flavor and recipe factors of each pair
+def SF(FF, RF):
+    return FF / (1 + RF)
+
+# utils.MedFF over every pair in C (pairs sharing nothing have a flavor factor of 0)
+def MedFF(C):
+    FFs = pair_JI(C)
+    if len(FFs) == 0: return 0.0
+    Min = FFs.min() if len(FFs) == num_pairs(C) else 0.0
+    return (Min + FFs.max()) / 2
+
+# utils.MeanCommonFlavors over every pair in C
+def MeanCommonFlavors(C):
+    return float(C.Common.sum()) / num_pairs(C)
+
+##############################################
+############# Network Edge Sets ##############
+##############################################
+
+# Each function returns the (AIIds, BIIds, Weights) arrays of a network's edges with AIId < BIId.
+# F and R are the flavor and recipe pair counts of the same (sorted) node ids. Pairs without
+# any common neighbor are never returned, so thresholds below 1 behave like a threshold of 1.
+
+# Original Complement Network edges (PMI over recipes)
+def ocn_edges(R, NR, RecipeThreshold=0):
+    Mask = R.Common >= RecipeThreshold
+    Rows, Cols, Common = R.Rows[Mask], R.Cols[Mask], R.Common[Mask]
+    W = PMI(Common, R.Degrees[Rows], R.Degrees[Cols], NR)
+    return R.NIds[Rows], R.NIds[Cols], W
+
+# Food Pairing Hypothesis Network edges (FPHF over flavors and recipes)
+def fph_edges(F, R, MedFF, RecipeThreshold=0):
+    Mask = R.Common >= RecipeThreshold
+    Rows, Cols, Common = R.Rows[Mask], R.Cols[Mask], R.Common[Mask]
+    RF = JI(Common, R.Degrees[Rows], R.Degrees[Cols])
+    W = FPHF(lookup_JI(F, Rows, Cols), RF, MedFF)
+    Keep = W > 0
+    return R.NIds[Rows[Keep]], R.NIds[Cols[Keep]], W[Keep]
+
+# Updated Complement Network edges (COF over flavors and recipes)
+def ucn_edges(F, R, NR, MedFF, RecipeThreshold=0):
+    Mask = R.Common >= RecipeThreshold
+    Rows, Cols, Common = R.Rows[Mask], R.Cols[Mask], R.Common[Mask]
+    PMIScore = PMI(Common, R.Degrees[Rows], R.Degrees[Cols], NR)
+    W = COF(lookup_JI(F, Rows, Cols), PMIScore, MedFF)
+    return R.NIds[Rows], R.NIds[Cols], W
+
+# Substitution Network edges (SF over flavors and recipes)
+def sn_edges(F, R, FlavorThreshold=0):
+    Mask = F.Common >= FlavorThreshold
+    Rows, Cols, Common = F.Rows[Mask], F.Cols[Mask], F.Common[Mask]
+    FF = JI(Common, F.Degrees[Rows], F.Degrees[Cols])
+    W = SF(FF, lookup_JI(R, Rows, Cols))
+    Keep = W > 0
+    return F.NIds[Rows[Keep]], F.NIds[Cols[Keep]], W[Keep]
+
+##############################################
+########### Streaming Recipe Counts ##########
+##############################################
+
+# Ingredient co-occurrence counts accumulated one chunk of recipes at a time, so a recipe corpus
+# never has to be held in memory (or as a recipe graph). Memory is bounded by the number of
+# ingredients and cuisines, not the number of recipes:
+#   Pairs:       upper-triangular (IId x IId) sparse matrix of the number of recipes sharing each pair
+#   Degrees:     number of recipes containing each ingredient
+#   NumRecipes:  number of recipes counted
+#   Cuisines:    number of recipes of each cuisine
+#   CuisineIngredients: number of recipes of each cuisine containing each ingredient
+class RecipeCounts():
+    def __init__(self, NumIngredients):
+        self.Pairs = sp.csr_matrix((NumIngredients, NumIngredients), dtype=np.int64)
+        self.Degrees = np.zeros(NumIngredients, dtype=np.int64)
+        self.NumRecipes = 0
+        self.Cuisines = collections.Counter()
+        self.CuisineIngredients = {}
+
+    # Count a chunk of recipes, given as lists of IIds, and their cuisines
+    def add(self, Recipes, Cuisines):
+        N = len(self.Degrees)
+        Offsets = np.concatenate([[0], np.cumsum([len(Recipe) for Recipe in Recipes])])
+        Cols = np.array([IId for Recipe in Recipes for IId in Recipe], dtype=np.int64)
+        Data = np.ones(len(Cols), dtype=np.int64)
+        A = sp.csr_matrix((Data, Cols, Offsets), shape=(len(Recipes), N))
+        # An ingredient listed twice in a recipe is still a single recipe edge
+        A.sum_duplicates()
+        A.data[:] = 1
+        self.Pairs = self.Pairs + sp.triu(A.T.dot(A), k=1).tocsr()
+        self.Degrees += np.asarray(A.sum(0)).ravel()
+        self.NumRecipes += len(Recipes)
+        Cuisines = np.asarray(Cuisines)
+        for Cuisine in set(Cuisines.tolist()):
+            Mask = Cuisines == Cuisine
+            self.Cuisines[Cuisine] += int(Mask.sum())
+            Counts = np.asarray(A[Mask].sum(0)).ravel()
+            if Cuisine in self.CuisineIngredients:
+                self.CuisineIngredients[Cuisine] += Counts
+            else:
+                self.CuisineIngredients[Cuisine] = Counts
+
+    # Add the counts of another RecipeCounts over the same ingredients (e.g. a batch of new recipes)
+    def merge(self, Other):
+        self.Pairs = self.Pairs + Other.Pairs
+        self.Degrees += Other.Degrees
+        self.NumRecipes += Other.NumRecipes
+        self.Cuisines.update(Other.Cuisines)
+        for Cuisine, Counts in Other.CuisineIngredients.iteritems():
+            if Cuisine in self.CuisineIngredients:
+                self.CuisineIngredients[Cuisine] = self.CuisineIngredients[Cuisine] + Counts
+            else:
+                self.CuisineIngredients[Cuisine] = Counts.copy()
+
+    # Save the counts as a numpy archive
+    def save(self, filename):
+        CuisineNames = sorted(self.Cuisines.keys())
+        with open(filename, 'wb') as f:
+            np.savez(f, PairsData=self.Pairs.data, PairsIndices=self.Pairs.indices, PairsIndptr=self.Pairs.indptr,
+                     Degrees=self.Degrees, NumRecipes=self.NumRecipes, CuisineNames=np.array(CuisineNames),
+                     CuisineRecipes=np.array([self.Cuisines[Cuisine] for Cuisine in CuisineNames], dtype=np.int64),
+                     CuisineIngredients=np.array([self.CuisineIngredients[Cuisine] for Cuisine in CuisineNames], dtype=np.int64).reshape(len(CuisineNames), -1))
+
+    # Load counts saved with save
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            Counts = cls(len(f['Degrees']))
+            N = len(Counts.Degrees)
+            Counts.Pairs = sp.csr_matrix((f['PairsData'], f['PairsIndices'], f['PairsIndptr']), shape=(N, N))
+            Counts.Degrees = f['Degrees']
+            Counts.NumRecipes = int(f['NumRecipes'])
+            for Cuisine, Recipes, Ingredients in zip(f['CuisineNames'].tolist(), f['CuisineRecipes'].tolist(), f['CuisineIngredients']):
+                Counts.Cuisines[Cuisine] = Recipes
+                Counts.CuisineIngredients[Cuisine] = Ingredients
+        return Counts
+
+    # The pair counts of the given sorted IIds (the same as pair_counts on the recipe graph)
+    def pair_counts(self, NIds):
+        NIds = np.asarray(NIds, dtype=np.int64)
+        Block = self.Pairs[NIds][:, NIds].tocsr()
+        Block.eliminate_zeros()
+        Block.sort_indices()
+        Block = Block.tocoo()
+        return PairCounts(NIds, self.Degrees[NIds], Block.row.astype(np.int64), Block.col.astype(np.int64), Block.data)
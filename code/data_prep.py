@@ -2,8 +2,15 @@ import snap
 import numpy as np
 import pandas as pd
 import utils as ut
+import cooccurrence as co
+import pair_scoring as ps
+import recipe_corpus as rc
+import build_cache as bc
+import convert_to_nx as cnx
 import collections
 import pickle
+import os
+import argparse
 
 ##############################################
 ########### Data Reading Functions ###########
@@ -131,6 +138,22 @@ def get_recipes_info(filenames=recipe_filenames):
         
     return rid_to_ingredients, cuisine_to_ingredients, ingredient_to_cuisines, rid_to_cuisine, cuisine_to_rids
 
+# Read the recipe files ChunkSize recipes at a time, yielding (Cuisines, Lists of Ingredients) per chunk
+def read_recipe_chunks(filenames=recipe_filenames, ChunkSize=100000):
+    Cuisines, Recipes = [], []
+    for filename in filenames:
+        with open(filename) as file:
+            for line in file:
+                line = line.split()
+                if len(line) == 0: continue
+                Cuisines.append(clean_cuisine(line[0].lower()))
+                Recipes.append(line[1:])
+                if len(Recipes) == ChunkSize:
+                    yield Cuisines, Recipes
+                    Cuisines, Recipes = [], []
+    if len(Recipes) > 0:
+        yield Cuisines, Recipes
+
 # Region Information (Cuisine, Region)
 regions_file = '../data/scirep-cuisines-detail/map.txt'
 def get_region_info(filename=regions_file):
@@ -171,9 +194,10 @@ mapping_names = [
     'Cuisine_to_Regions',
     'Region_to_Cuisines'
 ]
-# Save the list of mappings
+# Save the list of mappings (the recipe mappings are saved as the recipe corpus instead)
 def save_mappings(mappings):
     for i, mapping in enumerate(mappings):
+        if mapping_names[i] in rc.view_names: continue
         filename = '../data/mappings/{}.pkl'.format(mapping_names[i])
         with open(filename, 'wb') as f:
             pickle.dump(mapping, f, pickle.HIGHEST_PROTOCOL)
@@ -269,43 +293,79 @@ def new_cuisine_mappings(old_to_new, rid_to_cuisine, cuisine_to_rids):
 def save_weights(weights, filename):
     with open(filename, 'wb') as f:
         pickle.dump(weights, f, pickle.HIGHEST_PROTOCOL)
-    
+
+# Save a weighted adjacency (see utils.build_adjacency) as a numpy archive
+def save_adjacency(adjacency, filename):
+    with open(filename, 'wb') as f:
+        np.savez(f, **adjacency._asdict())
+
+# Save the binary edge arrays of a network (see utils.EdgeArrays) as a numpy archive
+def save_edge_arrays(NIds, Edges, filename):
+    AIIds, BIIds, W = Edges
+    with open(filename, 'wb') as f:
+        np.savez(f, NIds=np.asarray(NIds, dtype=np.int32), Src=np.asarray(AIIds, dtype=np.int32),
+                 Dst=np.asarray(BIIds, dtype=np.int32), Weights=np.asarray(W, dtype=np.float32))
+
+# Add the (AIIds, BIIds, Weights) edge arrays from the co-occurrence engine to G and return the weights
+def add_weighted_edges(G, AIIds, BIIds, W):
+    Weights = {}
+    for AIId, BIId, Weight in zip(AIIds.tolist(), BIIds.tolist(), W.tolist()):
+        G.AddEdge(AIId, BIId)
+        Weights[(AIId, BIId)] = Weight
+    return Weights
+
+# Build a network over NIds from co-occurrence engine edge arrays and save its graph, weights and edge arrays
+def save_network(NIds, Edges, graph_filename, weights_filename):
+    G = snap.TUNGraph.New()
+    # Add Nodes to the Network
+    for NId in NIds: G.AddNode(NId)
+    # Add Weighted Edges
+    Weights = add_weighted_edges(G, *Edges)
+    # Save Graph
+    save_graph(G, graph_filename)
+    # Save Weights
+    save_weights(Weights, weights_filename)
+    # Save Binary Edge Arrays
+    save_edge_arrays(NIds, Edges, ut.edge_arrays_file(graph_filename))
+    return Weights
+
 ##############################################
-######## Original Complement Network #########
+######## Shared Network Pair Statistics ######
 ##############################################
 
-ocn_graph_file = '../data/graphs/ocn.graph'
-ocn_weights_file = '../data/weights/ocn_weights.pkl'
-def build_original_complement_network(RecipeThreshold=20):
+# Per-pair statistics shared by all of the networks:
+#   OCNIds / NIds: sorted ingredients in the OCN (recipe graph only) and in the other networks (both graphs)
+#   ROCN / R / F: recipe pair counts over OCNIds, recipe and flavor pair counts over NIds
+#   NumRecipes, MedFF, MeanCommonFlavors: the global normalizers of the network metrics
+NetworkStatistics = collections.namedtuple('NetworkStatistics',
+    ['OCNIds', 'NIds', 'ROCN', 'R', 'F', 'NumRecipes', 'MedFF', 'MeanCommonFlavors'])
+
+# Load the bipartite graphs once (unless given) and compute the pair statistics of every network from them
+def get_network_statistics(BasicGraphs=None):
     # Get original Bipartite Graphs
-    IFG, IRG, Mappings = ut.load_basic_graphs()
+    IFG, IRG, Mappings = BasicGraphs or ut.load_basic_graphs()
     IIds = Mappings['IID_to_Ingredient_Mapping'].keys()
-    RIds = Mappings['RID_to_List_of_Ingredients_Mapping'].keys()
-    
-    OCN = snap.TUNGraph.New()
-    Weights = {}
     
-    # Add Nodes to Complement Network
-    for IId in IIds:
-        # Skip nodes that were pruned
-        if not IRG.IsNode(IId): continue
-        # Otherwise Add Node
-        OCN.AddNode(IId)
-        
-    # Go through all pairs of nodes and add an edge weighted by PMI
-    NumRecipes = len(RIds)
-    NIds = [NI.GetId() for NI in OCN.Nodes()]
-    for i, AIId in enumerate(NIds[:-1]):
-        for BIId in NIds[i+1:]:
-            B, W = ut.PMI(IRG, AIId, BIId, NumRecipes, RecipeThreshold)
-            if B:
-                OCN.AddEdge(AIId, BIId)
-                Weights[(AIId, BIId)] = W
+    # Skip nodes that were pruned
+    OCNIds = sorted([IId for IId in IIds if IRG.IsNode(IId)])
+    NIds = sorted([IId for IId in OCNIds if IFG.IsNode(IId)])
     
-    # Save Graph
-    save_graph(OCN, ocn_graph_file)
-    # Save Weights
-    save_weights(Weights, ocn_weights_file)
+    # Count common flavors and recipes for all pairs of nodes at once
+    F, R = co.pair_counts(IFG, NIds), co.pair_counts(IRG, NIds)
+    ROCN = R if OCNIds == NIds else co.pair_counts(IRG, OCNIds)
+    return NetworkStatistics(OCNIds, NIds, ROCN, R, F, len(Mappings['RID_to_List_of_Ingredients_Mapping']), co.MedFF(F), co.MeanCommonFlavors(F))
+
+##############################################
+######## Original Complement Network #########
+##############################################
+
+ocn_graph_file = '../data/graphs/ocn.graph'
+ocn_weights_file = '../data/weights/ocn_weights.pkl'
+def build_original_complement_network(RecipeThreshold=20, Stats=None):
+    if Stats is None: Stats = get_network_statistics()
+    # Add an edge weighted by PMI between pairs of nodes sharing enough recipes
+    Edges = co.ocn_edges(Stats.ROCN, Stats.NumRecipes, RecipeThreshold)
+    save_network(Stats.OCNIds, Edges, ocn_graph_file, ocn_weights_file)
 
 ##############################################
 ###### Food Pairing Hypothesis Network #######
@@ -313,36 +373,11 @@ def build_original_complement_network(RecipeThreshold=20):
 
 fph_graph_file = '../data/graphs/fph.graph'
 fph_weights_file = '../data/weights/fph_weights.pkl'
-def build_food_pairing_hypothesis_network(RecipeThreshold=20):
-    # Get original Bipartite Graphs
-    IFG, IRG, Mappings = ut.load_basic_graphs()
-    IIds = Mappings['IID_to_Ingredient_Mapping'].keys()
-    RIds = Mappings['RID_to_List_of_Ingredients_Mapping'].keys()
-    
-    FPH = snap.TUNGraph.New()
-    Weights = {}
-    
-    # Add Nodes to Complement Network
-    for IId in IIds:
-        # Skip nodes that were pruned
-        if not IFG.IsNode(IId) or not IRG.IsNode(IId): continue
-        # Otherwise Add Node
-        FPH.AddNode(IId)
-        
-    # Go through all pairs of nodes and add an edge weighted by PMI
-    NIds = [NI.GetId() for NI in FPH.Nodes()]
-    MedFF = ut.MedFF(IFG, NIds)
-    for i, AIId in enumerate(NIds[:-1]):
-        for BIId in NIds[i+1:]:
-            B, W = ut.FPHF(IFG, IRG, AIId, BIId, MedFF, RecipeThreshold)
-            if B:
-                FPH.AddEdge(AIId, BIId)
-                Weights[(AIId, BIId)] = W
-    
-    # Save Graph
-    save_graph(FPH, fph_graph_file)
-    # Save Weights
-    save_weights(Weights, fph_weights_file)
+def build_food_pairing_hypothesis_network(RecipeThreshold=20, Stats=None):
+    if Stats is None: Stats = get_network_statistics()
+    # Add an edge weighted by FPHF between pairs of nodes sharing enough recipes
+    Edges = co.fph_edges(Stats.F, Stats.R, Stats.MedFF, RecipeThreshold)
+    save_network(Stats.NIds, Edges, fph_graph_file, fph_weights_file)
 
 ##############################################
 ######### Updated Complement Network #########
@@ -350,37 +385,11 @@ def build_food_pairing_hypothesis_network(RecipeThreshold=20):
 
 ucn_graph_file = '../data/graphs/ucn.graph'
 ucn_weights_file = '../data/weights/ucn_weights.pkl'
-def build_updated_complement_network(RecipeThreshold=20):
-    # Get original Bipartite Graphs
-    IFG, IRG, Mappings = ut.load_basic_graphs()
-    IIds = Mappings['IID_to_Ingredient_Mapping'].keys()
-    RIds = Mappings['RID_to_List_of_Ingredients_Mapping'].keys()
-    
-    UCN = snap.TUNGraph.New()
-    Weights = {}
-    
-    # Add Nodes to Complement Network
-    for IId in IIds:
-        # Skip nodes that were pruned
-        if not IFG.IsNode(IId) or not IRG.IsNode(IId): continue
-        # Otherwise Add Node
-        UCN.AddNode(IId)
-        
-    # Go through all pairs of nodes and add an edge weighted by PMI
-    NumRecipes = len(RIds)
-    NIds = [NI.GetId() for NI in UCN.Nodes()]
-    MedFF = ut.MedFF(IFG, NIds)
-    for i, AIId in enumerate(NIds[:-1]):
-        for BIId in NIds[i+1:]:
-            B, W = ut.COF(IFG, IRG, AIId, BIId, NumRecipes, MedFF, RecipeThreshold)
-            if B:
-                UCN.AddEdge(AIId, BIId)
-                Weights[(AIId, BIId)] = W
-    
-    # Save Graph
-    save_graph(UCN, ucn_graph_file)
-    # Save Weights
-    save_weights(Weights, ucn_weights_file)
+def build_updated_complement_network(RecipeThreshold=20, Stats=None):
+    if Stats is None: Stats = get_network_statistics()
+    # Add an edge weighted by COF between pairs of nodes sharing enough recipes
+    Edges = co.ucn_edges(Stats.F, Stats.R, Stats.NumRecipes, Stats.MedFF, RecipeThreshold)
+    save_network(Stats.NIds, Edges, ucn_graph_file, ucn_weights_file)
 
 ##############################################
 ####### Inferred Substitution Netowork #######
@@ -388,37 +397,185 @@ def build_updated_complement_network(RecipeThreshold=20):
 
 sn_graph_file = '../data/graphs/sn.graph'
 sn_weights_file = '../data/weights/sn_weights.pkl'
-def build_substitution_network():
-    # Get original Bipartite Graphs
-    IFG, IRG, Mappings = ut.load_basic_graphs()
-    IIds = Mappings['IID_to_Ingredient_Mapping'].keys()
-    RIds = Mappings['RID_to_List_of_Ingredients_Mapping'].keys()
-    
-    SN = snap.TUNGraph.New()
-    Weights = {}
-    
-    # Add Nodes to Complement Network
-    for IId in IIds:
-        # Skip nodes that were pruned
-        if not IFG.IsNode(IId) or not IRG.IsNode(IId): continue
-        # Otherwise Add Node
-        SN.AddNode(IId)
-        
-    # Go through all pairs of nodes and add an edge weighted by PMI
-    NIds = [NI.GetId() for NI in SN.Nodes()]
-    FlavorThreshold = ut.MeanCommonFlavors(IFG, NIds)
+sn_adjacency_file = '../data/weights/sn_adjacency.npz'
+def build_substitution_network(Stats=None):
+    if Stats is None: Stats = get_network_statistics()
+    # Add an edge weighted by SF between pairs of nodes sharing enough flavors
+    FlavorThreshold = Stats.MeanCommonFlavors
     print 'Mean Common Flavors:', FlavorThreshold
-    for i, AIId in enumerate(NIds[:-1]):
-        for BIId in NIds[i+1:]:
-            B, W = ut.SF(IFG, IRG, AIId, BIId, FlavorThreshold)
-            if B:
-                SN.AddEdge(AIId, BIId)
-                Weights[(AIId, BIId)] = W
-    
-    # Save Graph
-    save_graph(SN, sn_graph_file)
-    # Save Weights
-    save_weights(Weights, sn_weights_file)
+    Edges = co.sn_edges(Stats.F, Stats.R, FlavorThreshold)
+    Weights = save_network(Stats.NIds, Edges, sn_graph_file, sn_weights_file)
+    # Save the per-ingredient adjacency used for substitute lookups
+    save_adjacency(ut.build_adjacency(Weights), sn_adjacency_file)
+
+##############################################
+######## Streaming Network Statistics ########
+##############################################
+
+# Count ingredient co-occurrences of the recipe files chunk by chunk (see cooccurrence.RecipeCounts)
+def count_recipes(iid_to_ingredient, filenames=recipe_filenames, ChunkSize=100000):
+    ingredient_to_iid = {Ingredient:iid for iid, Ingredient in iid_to_ingredient.iteritems()}
+    Counts = co.RecipeCounts(max(iid_to_ingredient.keys()) + 1)
+    for Cuisines, Recipes in read_recipe_chunks(filenames, ChunkSize):
+        Counts.add([[ingredient_to_iid[Ingredient] for Ingredient in Ingredients] for Ingredients in Recipes], Cuisines)
+    return Counts
+
+# Compute the network statistics from recipe counts instead of the ingredient recipe graph
+def get_streaming_network_statistics(Counts, IFG, iid_to_ingredient):
+    # Skip ingredients that appear in no recipe (the nodes prune_graphs would remove)
+    OCNIds = sorted([IId for IId in iid_to_ingredient.keys() if Counts.Degrees[IId] > 0])
+    NIds = [IId for IId in OCNIds if IFG.IsNode(IId)]
+    F, R = co.pair_counts(IFG, NIds), Counts.pair_counts(NIds)
+    ROCN = R if OCNIds == NIds else Counts.pair_counts(OCNIds)
+    return NetworkStatistics(OCNIds, NIds, ROCN, R, F, Counts.NumRecipes, co.MedFF(F), co.MeanCommonFlavors(F))
+
+# Build the networks from recipe files of any size without building the ingredient recipe graph.
+# Only the (small) ingredient flavor graph is built in memory; recipes are read ChunkSize at a time.
+def build_streaming_networks(filenames=recipe_filenames, ChunkSize=100000):
+    IFG, iid_to_ingredient = get_ingredient_flavor_graph()
+    print 'Counting Recipes...'
+    Counts = count_recipes(iid_to_ingredient, filenames, ChunkSize)
+    print 'Recipes:', Counts.NumRecipes
+    print 'Computing Pair Statistics...'
+    build_networks(get_streaming_network_statistics(Counts, IFG, iid_to_ingredient))
+    # Keep the counts so that new recipes can be added with update_networks (the build cache no longer
+    # describes them, so the recipes it recorded as added are dropped)
+    Counts.save(recipe_counts_file)
+    bc.BuildCache().forget('recipe_counts')
+    return Counts
+
+# Build the (unpruned) ingredient flavor graph and its ingredient mapping in memory
+def get_ingredient_flavor_graph():
+    print 'Building Ingredient Flavor Graph...'
+    ingredient_mappings = get_ingredient_info()
+    flavor_mappings = get_flavor_info()
+    IFG, iid_to_ingredient, fid_to_flavor = build_ingredient_flavor_graph(ingredient_mappings[0], flavor_mappings[0], get_ingredient_flavor_info())
+    return IFG, iid_to_ingredient
+
+##############################################
+######## Incremental Network Updates #########
+##############################################
+
+# Co-occurrence counts of every recipe in the networks (see cooccurrence.RecipeCounts)
+recipe_counts_file = '../data/weights/recipe_counts.npz'
+
+# Load the saved recipe counts (counted from the base recipe files if they have not been saved yet)
+def load_recipe_counts(iid_to_ingredient, ChunkSize=100000):
+    if not os.path.exists(recipe_counts_file):
+        return count_recipes(iid_to_ingredient, recipe_filenames, ChunkSize)
+    return co.RecipeCounts.load(recipe_counts_file)
+
+# Count the recipes of the given files and save them as the recipe counts
+def save_recipe_counts(filenames, ChunkSize=100000):
+    IFG, iid_to_ingredient = get_ingredient_flavor_graph()
+    print 'Counting Recipes...'
+    count_recipes(iid_to_ingredient, filenames, ChunkSize).save(recipe_counts_file)
+
+# Drop the saved recipe counts once the networks are rebuilt from the base recipes, so that they are
+# counted again from the base recipe files instead of still holding recipes added by update_networks
+# (which are dropped from the build cache as well)
+def reset_recipe_counts():
+    if os.path.exists(recipe_counts_file):
+        os.remove(recipe_counts_file)
+    bc.BuildCache().forget('recipe_counts')
+
+# The recipe threshold the saved OCN, FPH and UCN were built with, as recorded in the build cache
+# (None if it was not recorded or they were built with different thresholds)
+def network_threshold(Cache):
+    Thresholds = set((Cache.stage_params(name) or {}).get('RecipeThreshold') for name in ['ocn', 'fph', 'ucn'])
+    return Thresholds.pop() if len(Thresholds) == 1 else None
+
+# Edge arrays of the saved weights of a network without the edges touching any of Nodes
+def unaffected_edges(weights_filename, Nodes):
+    Weights = ut.load_weights(weights_filename)
+    Edges = np.array(Weights.keys(), dtype=np.int64).reshape(-1, 2)
+    W = np.array(Weights.values(), dtype=np.float64)
+    Keep = ~(np.in1d(Edges[:, 0], Nodes) | np.in1d(Edges[:, 1], Nodes))
+    return Edges[Keep, 0], Edges[Keep, 1], W[Keep]
+
+# Concatenate two sets of (AIIds, BIIds, Weights) edge arrays
+def merge_edges(AEdges, BEdges):
+    return tuple(np.concatenate([A, B]) for A, B in zip(AEdges, BEdges))
+
+# Add the recipes of new_recipe_files to the saved recipe counts and update the networks in place.
+# Only the ingredients in the new recipes change degree, so only pairs touching them are rescored.
+# The other recipe based weights only depend on the recipe total through the log(NR) term of PMI,
+# so the OCN and UCN weights of unaffected pairs are shifted by the change in log(NR).
+# The networks are rebuilt from the counts if the new recipes introduce new ingredients,
+# since the flavor normalizers (MedFF, MeanCommonFlavors) depend on the set of ingredients.
+# The update is recorded in the build cache as if build_pipeline had built the counts and networks with
+# the new recipe files added, so that the pipeline keeps them when it rebuilds (see build_pipeline). The
+# recipe threshold defaults to the one the networks were built with, which must be passed if the cache
+# has no record of it.
+def update_networks(new_recipe_files, RecipeThreshold=None, ChunkSize=100000):
+    Cache = bc.BuildCache()
+    BuiltThreshold = network_threshold(Cache)
+    if RecipeThreshold is None:
+        RecipeThreshold = BuiltThreshold
+    if RecipeThreshold is None:
+        raise ValueError('The recipe threshold the networks were built with is not recorded, pass it to update_networks')
+    if BuiltThreshold is not None and RecipeThreshold != BuiltThreshold:
+        raise ValueError('The networks were built with recipe threshold {}, not {}'.format(BuiltThreshold, RecipeThreshold))
+    IFG, iid_to_ingredient = get_ingredient_flavor_graph()
+    Counts = load_recipe_counts(iid_to_ingredient, ChunkSize)
+    OldOCNIds, OldNR = np.flatnonzero(Counts.Degrees > 0), Counts.NumRecipes
+    print 'Counting New Recipes...'
+    NewCounts = count_recipes(iid_to_ingredient, new_recipe_files, ChunkSize)
+    print 'New Recipes:', NewCounts.NumRecipes
+    Counts.merge(NewCounts)
+    print 'Computing Pair Statistics...'
+    Stats = get_streaming_network_statistics(Counts, IFG, iid_to_ingredient)
+    
+    if not np.array_equal(OldOCNIds, Stats.OCNIds):
+        print 'New Ingredients Found, Rebuilding Networks...'
+        build_networks(Stats, RecipeThreshold)
+    else:
+        Affected = np.flatnonzero(NewCounts.Degrees > 0)
+        Shift = np.log(Stats.NumRecipes) - np.log(OldNR)
+        print 'Updating Original Complement Network...'
+        AIIds, BIIds, W = unaffected_edges(ocn_weights_file, Affected)
+        Edges = co.ocn_edges(co.restrict(Stats.ROCN, Affected), Stats.NumRecipes, RecipeThreshold)
+        save_network(Stats.OCNIds, merge_edges((AIIds, BIIds, W + Shift), Edges), ocn_graph_file, ocn_weights_file)
+        print 'Updating Food Pairing Hypothesis Network...'
+        Edges = co.fph_edges(Stats.F, co.restrict(Stats.R, Affected), Stats.MedFF, RecipeThreshold)
+        save_network(Stats.NIds, merge_edges(unaffected_edges(fph_weights_file, Affected), Edges), fph_graph_file, fph_weights_file)
+        print 'Updating Updated Complement Network...'
+        AIIds, BIIds, W = unaffected_edges(ucn_weights_file, Affected)
+        Edges = co.ucn_edges(Stats.F, co.restrict(Stats.R, Affected), Stats.NumRecipes, Stats.MedFF, RecipeThreshold)
+        save_network(Stats.NIds, merge_edges((AIIds, BIIds, W + Shift), Edges), ucn_graph_file, ucn_weights_file)
+        print 'Updating Substitution Network...'
+        Edges = co.sn_edges(co.restrict(Stats.F, Affected), Stats.R, Stats.MeanCommonFlavors)
+        Weights = save_network(Stats.NIds, merge_edges(unaffected_edges(sn_weights_file, Affected), Edges), sn_graph_file, sn_weights_file)
+        save_adjacency(ut.build_adjacency(Weights), sn_adjacency_file)
+    
+    Counts.save(recipe_counts_file)
+    Cache.record(*recipe_counts_stage(recorded_updates(Cache) + list(new_recipe_files)))
+    for name in ['ocn', 'fph', 'ucn', 'sn']:
+        Cache.record(*network_stage(name, RecipeThreshold))
+    return Counts
+
+##############################################
+######### Custom Metric Pair Networks ########
+##############################################
+
+# Build a network by scoring every pair of NIds with a utils-style pair metric on a process pool
+# (Metric(*Graphs, AIId, BIId, *Params) -> (B, W), see pair_scoring.score_pairs)
+def build_metric_network(Metric, Graphs, Params, NIds, graph_filename, weights_filename, Workers=None):
+    Edges = ps.score_pairs(Metric, NIds, Graphs, Params, Workers)
+    return save_network(NIds, Edges, graph_filename, weights_filename)
+
+# Build the four networks with the scalar metrics in utils, scored in parallel across Workers processes
+def build_networks_with_metrics(RecipeThreshold=20, Workers=None):
+    IFG, IRG, Mappings = BasicGraphs = ut.load_basic_graphs()
+    Stats = get_network_statistics(BasicGraphs)
+    IFG, IRG = ut.NeighborIndex(IFG), ut.NeighborIndex(IRG)
+    NR, MedFF = Stats.NumRecipes, Stats.MedFF
+    build_metric_network(ut.PMI, (IRG,), (NR, RecipeThreshold), Stats.OCNIds, ocn_graph_file, ocn_weights_file, Workers)
+    build_metric_network(ut.FPHF, (IFG, IRG), (MedFF, RecipeThreshold), Stats.NIds, fph_graph_file, fph_weights_file, Workers)
+    build_metric_network(ut.COF, (IFG, IRG), (NR, MedFF, RecipeThreshold), Stats.NIds, ucn_graph_file, ucn_weights_file, Workers)
+    SW = build_metric_network(ut.SF, (IFG, IRG), (Stats.MeanCommonFlavors,), Stats.NIds, sn_graph_file, sn_weights_file, Workers)
+    save_adjacency(ut.build_adjacency(SW), sn_adjacency_file)
+    reset_recipe_counts()
 
 ##############################################
 ############### Build Graphs #################
@@ -474,28 +631,209 @@ def build_basic_graphs():
     ]
     save_mappings(mappings)
     
-# Build Networks
-def build_networks():
-    RecipeThreshold = 25
+    # Save the recipes as the columnar recipe corpus
+    rc.RecipeCorpus.from_mappings(rid_to_ingredients, rid_to_cuisine, iid_to_ingredient).save()
+    
+# Build Networks (from the given network statistics, or the saved bipartite graphs)
+def build_networks(Stats=None, RecipeThreshold=25):
+    # Load the bipartite graphs and compute the shared pair statistics once for all networks
+    if Stats is None:
+        print 'Computing Pair Statistics...'
+        Stats = get_network_statistics()
+        reset_recipe_counts()
     print 'Building Original Complement Network...'
-    build_original_complement_network(RecipeThreshold)
+    build_original_complement_network(RecipeThreshold, Stats)
     print 'Building Food Pairing Hypothesis Network...'
-    build_food_pairing_hypothesis_network(RecipeThreshold)
+    build_food_pairing_hypothesis_network(RecipeThreshold, Stats)
     print 'Building Updated Complement Network...'
-    build_updated_complement_network(RecipeThreshold)
+    build_updated_complement_network(RecipeThreshold, Stats)
     print 'Building Substitution Network...'
-    build_substitution_network()
+    build_substitution_network(Stats)
+
+##############################################
+########## Recipe Threshold Sweep ############
+##############################################
+
+# The sweep writes its networks and summary to their own (untracked) directory, apart from the networks
+sweep_dir = '../data/sweep'
+
+# Graph and weights files of a network built with a given recipe threshold
+def sweep_files(name, RecipeThreshold):
+    return os.path.join(sweep_dir, '{}_t{}.graph'.format(name, RecipeThreshold)), \
+           os.path.join(sweep_dir, '{}_t{}_weights.pkl'.format(name, RecipeThreshold))
+
+# Size and weight distribution of a network's (AIIds, BIIds, Weights) edges over NIds
+def edge_summary(NIds, Edges):
+    N, W = len(NIds), Edges[2]
+    Summary = collections.OrderedDict()
+    Summary['Nodes'] = N
+    Summary['Edges'] = len(W)
+    Summary['Density'] = 2.0 * len(W) / (N * (N - 1)) if N > 1 else 0.0
+    for Stat, Function in [('Min', np.min), ('Mean', np.mean), ('Median', np.median), ('Max', np.max), ('Std', np.std)]:
+        Summary['{}Weight'.format(Stat)] = Function(W) if len(W) > 0 else np.nan
+    return Summary
+
+# Build the OCN, FPH and UCN for every recipe threshold from a single computation of the pair
+# statistics (the threshold only filters the common recipe counts) and summarize each network
+sweep_summary_file = os.path.join(sweep_dir, 'threshold_sweep.csv')
+def sweep_thresholds(RecipeThresholds, Stats=None, Save=True):
+    if Save and not os.path.exists(sweep_dir):
+        os.makedirs(sweep_dir)
+    if Stats is None:
+        print 'Computing Pair Statistics...'
+        Stats = get_network_statistics()
+    Rows = []
+    for RecipeThreshold in RecipeThresholds:
+        print 'Building Networks with Recipe Threshold {}...'.format(RecipeThreshold)
+        Networks = [
+            ('ocn', Stats.OCNIds, co.ocn_edges(Stats.ROCN, Stats.NumRecipes, RecipeThreshold)),
+            ('fph', Stats.NIds, co.fph_edges(Stats.F, Stats.R, Stats.MedFF, RecipeThreshold)),
+            ('ucn', Stats.NIds, co.ucn_edges(Stats.F, Stats.R, Stats.NumRecipes, Stats.MedFF, RecipeThreshold))
+        ]
+        for name, NIds, Edges in Networks:
+            if Save: save_network(NIds, Edges, *sweep_files(name, RecipeThreshold))
+            Row = collections.OrderedDict([('RecipeThreshold', RecipeThreshold), ('Network', name)])
+            Row.update(edge_summary(NIds, Edges))
+            Rows.append(Row)
+    Summary = pd.DataFrame(Rows, columns=Rows[0].keys() if Rows else None)
+    if Save: Summary.to_csv(sweep_summary_file, index=False)
+    return Summary
+
+##############################################
+############ Cached Build Pipeline ###########
+##############################################
+
+# Source data read by build_basic_graphs
+source_files = [ingredient_info_file, flavor_info_file, ingredients_flavors_file, regions_file] + recipe_filenames
+
+# Code the networks are built with (a change to any of it invalidates the stages that use it)
+network_code_files = ['data_prep.py', 'cooccurrence.py', 'recipe_corpus.py', 'utils.py']
+
+# Everything each network stage writes
+network_outputs = {
+    'ocn': [ocn_graph_file, ocn_weights_file, ut.edge_arrays_file(ocn_graph_file)],
+    'fph': [fph_graph_file, fph_weights_file, ut.edge_arrays_file(fph_graph_file)],
+    'ucn': [ucn_graph_file, ucn_weights_file, ut.edge_arrays_file(ucn_graph_file)],
+    'sn': [sn_graph_file, sn_weights_file, ut.edge_arrays_file(sn_graph_file), sn_adjacency_file]
+}
+
+# Files the ingredient flavor graph is built from
+flavor_source_files = [ingredient_info_file, flavor_info_file, ingredients_flavors_file]
+
+# Recipe files added to the networks with update_networks, as recorded in the build cache
+def recorded_updates(Cache):
+    return (Cache.stage_params('recipe_counts') or {}).get('updates', [])
+
+# The (name, inputs, outputs, params) of the recipe counts stage: the counts of the base recipe files
+# and of every file added with update_networks since
+def recipe_counts_stage(Updates):
+    return 'recipe_counts', flavor_source_files + recipe_filenames + Updates + network_code_files, [recipe_counts_file], {'updates': Updates}
+
+# The (name, inputs, outputs, params) of a network stage (the networks are built from the recipe counts)
+def network_stage(name, RecipeThreshold):
+    Params = None if name == 'sn' else {'RecipeThreshold': RecipeThreshold}
+    return name, [recipe_counts_file] + flavor_source_files + network_code_files, network_outputs[name], Params
+
+# Everything build_basic_graphs writes
+def basic_graph_files():
+    Mappings = [ut.mapping_file(name) for name in mapping_names if name not in rc.view_names]
+    return [ingredient_flavor_graph_file, ingredient_recipe_graph_file] + Mappings + rc.corpus_files()
+
+# Arguments node2vec is run with for every network
+node2vec_params = {
+    'dimensions': 128,
+    'walk-length': 80,
+    'num-walks': 10,
+    'window-size': 10,
+    'p': 1,
+    'q': 1,
+    'weighted': False
+}
+embedding_code_files = ['embed_networks.py', 'utils.py', '../node2vec/src/node2vec.py']
+
+# Learn the embeddings of a network and write its embedding store (see embed_networks.py, which is
+# imported here so that gensim is only needed when embeddings are built)
+def run_node2vec(name, params=node2vec_params):
+    import embed_networks as en
+    Args = []
+    for Param, Value in sorted(params.iteritems()):
+        if isinstance(Value, bool):
+            Args += ['--' + Param if Value else '--un' + Param]
+        else:
+            Args += ['--' + Param, str(Value)]
+    en.embed_network(name, en.parser.parse_args(Args))
+
+# Build the basic graphs and the networks (and their embeddings and text edgelists), skipping every
+# stage whose inputs, parameters and outputs are unchanged since it was last built (see build_cache).
+# The networks are built from the recipe counts, which include the recipes added with update_networks,
+# so rebuilding them (even when forced) keeps those recipes.
+def build_pipeline(RecipeThreshold=25, Embeddings=False, Edgelists=False, Force=False):
+    Cache = bc.BuildCache(Force=Force)
+    Cache.run('basic_graphs', source_files + network_code_files, basic_graph_files(), build_basic_graphs)
+    
+    Updates = recorded_updates(Cache)
+    Missing = [filename for filename in Updates if not os.path.exists(filename)]
+    if Missing:
+        raise IOError('Recipe files added with update_networks are missing: {}'.format(', '.join(Missing)))
+    Name, Inputs, Outputs, Params = recipe_counts_stage(Updates)
+    Cache.run(Name, Inputs, Outputs, lambda: save_recipe_counts(recipe_filenames + Updates), Params)
+    
+    # The pair statistics are only computed if some network has to be rebuilt, and then only once
+    Stats = []
+    def get_stats():
+        if len(Stats) == 0:
+            IFG, iid_to_ingredient = get_ingredient_flavor_graph()
+            print 'Computing Pair Statistics...'
+            Stats.append(get_streaming_network_statistics(co.RecipeCounts.load(recipe_counts_file), IFG, iid_to_ingredient))
+        return Stats[0]
+    
+    Builders = {
+        'ocn': lambda: build_original_complement_network(RecipeThreshold, get_stats()),
+        'fph': lambda: build_food_pairing_hypothesis_network(RecipeThreshold, get_stats()),
+        'ucn': lambda: build_updated_complement_network(RecipeThreshold, get_stats()),
+        'sn': lambda: build_substitution_network(get_stats())
+    }
+    for name in ['ocn', 'fph', 'ucn', 'sn']:
+        Name, Inputs, Outputs, Params = network_stage(name, RecipeThreshold)
+        Cache.run(Name, Inputs, Outputs, Builders[name], Params)
+    
+    # Text edgelists and embeddings of every network
+    Loaders = {'ocn': ut.load_ocn, 'fph': ut.load_fph, 'ucn': ut.load_ucn, 'sn': ut.load_sn}
+    Graphs = {'ocn': ocn_graph_file, 'fph': fph_graph_file, 'ucn': ucn_graph_file, 'sn': sn_graph_file}
+    Weights = {'ocn': ocn_weights_file, 'fph': fph_weights_file, 'ucn': ucn_weights_file, 'sn': sn_weights_file}
+    if Edgelists:
+        for name in ut.embedding_names:
+            Cache.run(name + '_edgelist', [Graphs[name], Weights[name], 'convert_to_nx.py'], [cnx.edgelist_file(name)],
+                      lambda: cnx.convert_to_edgelist(*(Loaders[name]() + (name,))))
+    if not Embeddings: return
+    for name in ut.embedding_names:
+        Cache.run(name + '_embeddings', [ut.edge_arrays_file(Graphs[name])] + embedding_code_files, list(ut.embedding_files(name)),
+                  lambda: run_node2vec(name), node2vec_params)
+    Stores = [f for name in ut.embedding_names for f in ut.embedding_files(name)]
+    Mappings = [ut.mapping_file('IID_to_Ingredient_Mapping'), ut.mapping_file('Cuisine_to_List_of_Ingredients_Mapping')]
+    Cache.run('cuisine_rows', Stores + Mappings + ['utils.py'], [ut.cuisine_rows_file], ut.save_cuisine_rows)
 
 ##############################################
 ########### Main Program Execution ###########
 ##############################################
 
+parser = argparse.ArgumentParser(description="Build the graphs and networks (skipping stages that are up to date).")
+parser.add_argument('--threshold',        type=int,          default=25,             help="Minimum number of common recipes of OCN, FPH and UCN edges")
+parser.add_argument('--embeddings',       action='store_true',                       help="Also learn the node2vec embeddings and write the embedding store")
+parser.add_argument('--edgelists',        action='store_true',                       help="Also export the networks as text edgelists")
+parser.add_argument('--force',            action='store_true',                       help="Rebuild every stage")
+parser.add_argument('--sweep',            type=int,          nargs='+', default=None, help="Build OCN, FPH and UCN for each of these recipe thresholds and summarize them")
+
 def main():
+    if args.sweep:
+        print 'Threshold Sweep:'
+        print sweep_thresholds(args.sweep).to_string(index=False)
+        return
     print 'Build Process:'
-    build_basic_graphs()
-    build_networks()
+    build_pipeline(args.threshold, args.embeddings, args.edgelists, args.force)
     print 'Done!'
 
 if __name__ == '__main__':
+    args = parser.parse_args()
     main()
 
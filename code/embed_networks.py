@@ -0,0 +1,75 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import numpy as np
+import utils as ut
+import convert_to_nx as cnx
+import convert_emb_to_pkl as emb
+sys.path.append('../node2vec/src')
+import node2vec
+from gensim.models import Word2Vec
+
+parser = argparse.ArgumentParser(description="Embed every network with node2vec and write the embedding store.")
+parser.add_argument('--networks',         type=str,          nargs='+', default=ut.embedding_names, help="Networks to embed")
+parser.add_argument('--dimensions',       type=int,          default=128,            help="Number of dimensions")
+parser.add_argument('--walk-length',      type=int,          default=80,             help="Length of walk per source")
+parser.add_argument('--num-walks',        type=int,          default=10,             help="Number of walks per source")
+parser.add_argument('--window-size',      type=int,          default=10,             help="Context size for optimization")
+parser.add_argument('--iter',             type=int,          default=1,              help="Number of epochs in SGD")
+parser.add_argument('--workers',          type=int,          default=8,              help="Number of walk processes and Word2Vec threads per network")
+parser.add_argument('--p',                type=float,        default=1,              help="Return hyperparameter")
+parser.add_argument('--q',                type=float,        default=1,              help="Inout hyperparameter")
+parser.add_argument('--seed',             type=int,          default=None,           help="Seed of the random walks")
+parser.add_argument('--rejection-sampling', action='store_true',                     help="Apply the p/q bias by rejection sampling instead of per-edge alias tables")
+parser.add_argument('--weighted',         dest='weighted', action='store_true',      help="Walk with the network weights as edge weights (default is unweighted)")
+parser.add_argument('--unweighted',       dest='weighted', action='store_false',     help="Walk with weight 1 on every edge")
+parser.set_defaults(weighted=False)
+parser.add_argument('--parallel',         action='store_true',                       help="Embed the networks at the same time, one process per network")
+parser.add_argument('--debug',            action='store_true',                       help="Also write the text edgelists and .emb files")
+
+# Learn the node2vec embeddings of a network and write its embedding store
+def embed_network(name, args):
+	print 'Embedding {}...'.format(name)
+	if args.debug:
+		cnx.convert_to_edgelist(*(ut.network_loaders[name]() + (name,)))
+	# Nodes without edges are left out, as in the text edgelists
+	E = ut.load_network_edges(name)
+	# The PMI and COF weights can be negative, so they are only usable as walk weights when asked for
+	Weights = E.Weights if args.weighted else np.ones_like(E.Weights)
+	graph = node2vec.CSRGraph.from_edges(E.Src, E.Dst, Weights, False, args.p, args.q, args.rejection_sampling)
+	graph.preprocess_transition_probs()
+	fd, walks_file = tempfile.mkstemp(suffix='.npy')
+	os.close(fd)
+	try:
+		walks = graph.write_walks(walks_file, args.num_walks, args.walk_length, args.workers, args.seed)
+		model = Word2Vec(walks, size=args.dimensions, window=args.window_size, min_count=0, sg=1, workers=args.workers, iter=args.iter)
+	finally:
+		os.remove(walks_file)
+	if args.debug:
+		model.save_word2vec_format(emb.emb_file(name))
+	ut.save_embedding_matrix(name, graph.nodes, np.array([model[str(NId)] for NId in graph.nodes.tolist()]))
+
+def embed_networks(args):
+	if args.parallel:
+		# The forked processes each load and embed one network
+		Processes = [multiprocessing.Process(target=embed_network, args=(name, args)) for name in args.networks]
+		for Process in Processes: Process.start()
+		for Process in Processes: Process.join()
+		Failed = [name for name, Process in zip(args.networks, Processes) if Process.exitcode != 0]
+		if Failed:
+			raise RuntimeError('Embedding failed for {}'.format(', '.join(Failed)))
+	else:
+		for name in args.networks:
+			embed_network(name, args)
+	# Precompute the rows of every cuisine's ingredients in each network's embedding matrix
+	ut.save_cuisine_rows()
+
+def main():
+	embed_networks(args)
+	print 'Done!'
+
+if __name__ == '__main__':
+	args = parser.parse_args()
+	main()
@@ -1,4 +1,5 @@
 import argparse
+import os
 import utils as ut
 import numpy as np
 
@@ -10,7 +11,6 @@ parser.add_argument('--min',                      type=int,          default=7,
 parser.add_argument('--max',                      type=int,          default=7,       help="Maximum number of ingredients in a recipe")
 parser.add_argument('--accent',                   type=int,          default=0,       help="Number of accent ingredients to use")
 parser.add_argument('-a', '--avoids',             action='append',   default=None,    help="Which ingredients to avoid using in the recipe")
-args = parser.parse_args()
 
 # Choose k random items from a dictionary
 def choose_random_seed(d, k=1):
@@ -18,10 +18,16 @@ def choose_random_seed(d, k=1):
 	return np.random.choice(iids, size=k, replace=False)
 
 
-def get_ranked_from_seeds(seeds, embeddings):
-	Centroid = np.array([embeddings[iid] for iid in seeds]).mean(0)
-	Ranked = sorted([(ut.euclidean_distance(Centroid, E), IId) for IId, E in embeddings.iteritems() if not IId in seeds])
-	return Ranked
+# Sample a row with probability proportional to 1 / (distance + 1), skipping excluded rows. Sampling
+# needs the whole distribution but not its order, so the candidates are never sorted.
+def choose_from_distances(Dists, Excluded):
+	CDF = np.cumsum(np.where(Excluded, 0.0, 1.0 / (Dists + 1)))
+	if CDF[-1] == 0:
+		raise ValueError('The recipe is larger than the {} available ingredients'.format(len(CDF)))
+	Row = np.searchsorted(CDF, np.random.rand() * CDF[-1], side='right')
+	# Guard against rounding at the top of the range (with some row left, the first row reaching the
+	# total is never excluded)
+	return Row if Row < len(CDF) else np.searchsorted(CDF, CDF[-1])
 
 def choose_new_ingredient(Ranked):
 	probs = np.array([1.0 / (d+1) for i, (d, IId) in enumerate(Ranked)])
@@ -42,40 +48,74 @@ def generate(embeddings, seeds, num_ingredients):
 	if seeds is None:
 		seeds = choose_random_seed(embeddings, 2)
 
-	while len(seeds) < num_ingredients:
-		# Calculate ranked list of ingredients to current seed set
-		Ranked = get_ranked_from_seeds(seeds, embeddings)
-		NewIngredientIId = choose_new_ingredient(Ranked)
-		seeds = np.append(seeds, [NewIngredientIId], axis=0)
-	return seeds
+	# Running state: the recipe buffer, the sum of the chosen embeddings and a mask of chosen rows
+	Recipe = np.empty(max(num_ingredients, len(seeds)), dtype=embeddings.IIds.dtype)
+	Recipe[:len(seeds)] = seeds
+	Rows = embeddings.rows(seeds)
+	Sum = embeddings.Vectors[Rows].sum(0)
+	Chosen = np.zeros(len(embeddings), dtype=bool)
+	Chosen[Rows] = True
 
-def get_embeddings(embeddings, network, mappings, cuisine=None):
-	if cuisine is None:
-		return embeddings[network]
+	for Size in range(len(seeds), num_ingredients):
+		# Distances of every ingredient to the centroid of the current recipe
+		Dists = np.sqrt(((embeddings.Vectors - Sum / Size) ** 2).sum(1))
+		Row = choose_from_distances(Dists, Chosen)
+		Recipe[Size] = embeddings.IIds[Row]
+		Sum += embeddings.Vectors[Row]
+		Chosen[Row] = True
+	return Recipe
 
-	ingredient_to_iid = {Ingredient:IId for IId, Ingredient in mappings['IID_to_Ingredient_Mapping'].iteritems()}
-	Ingredients = [ingredient_to_iid[Ingredient] for Ingredient in mappings['Cuisine_to_List_of_Ingredients_Mapping'][cuisine]]
+# Sample one row per batch entry from each row of distances (see choose_from_distances)
+def choose_batch_from_distances(Dists, Excluded):
+	CDF = np.cumsum(np.where(Excluded, 0.0, 1.0 / (Dists + 1)), axis=1)
+	if (CDF[:, -1] == 0).any():
+		raise ValueError('The recipe is larger than the {} available ingredients'.format(CDF.shape[1]))
+	Rows = (CDF <= (np.random.rand(len(CDF)) * CDF[:, -1])[:, None]).sum(1)
+	Over = Rows == CDF.shape[1]
+	Rows[Over] = (CDF[Over] < CDF[Over, -1:]).sum(1)
+	return Rows
 
-	return {IId:embeddings[network][IId] for IId in Ingredients if IId in embeddings[network].keys()}
+# Generates a batch of recipes from the provided network at once, one row of running state per recipe
+# (seeds is a list of seed IId arrays, num_ingredients an array of recipe sizes)
+def generate_batch(embeddings, seeds, num_ingredients):
+	Sizes = np.array([len(s) for s in seeds], dtype=np.int64)
+	Targets = np.maximum(num_ingredients, Sizes)
+	Recipes = np.zeros((len(seeds), Targets.max()), dtype=embeddings.IIds.dtype)
+	Sum = np.zeros((len(seeds), embeddings.Vectors.shape[1]), dtype=np.float32)
+	Chosen = np.zeros((len(seeds), len(embeddings)), dtype=bool)
+	for b, s in enumerate(seeds):
+		Rows = embeddings.rows(s)
+		Recipes[b, :len(s)] = s
+		Sum[b] = embeddings.Vectors[Rows].sum(0)
+		Chosen[b, Rows] = True
+
+	Norms = (embeddings.Vectors ** 2).sum(1)
+	Active = np.flatnonzero(Sizes < Targets)
+	while len(Active) > 0:
+		# Distances of every ingredient to the centroid of each unfinished recipe
+		Centroids = Sum[Active] / Sizes[Active, None]
+		Squared = Norms[None, :] - 2 * Centroids.dot(embeddings.Vectors.T) + (Centroids ** 2).sum(1)[:, None]
+		Rows = choose_batch_from_distances(np.sqrt(np.maximum(Squared, 0)), Chosen[Active])
+		Recipes[Active, Sizes[Active]] = embeddings.IIds[Rows]
+		Sum[Active] += embeddings.Vectors[Rows]
+		Chosen[Active, Rows] = True
+		Sizes[Active] += 1
+		Active = np.flatnonzero(Sizes < Targets)
+	return [Recipes[b, :Targets[b]] for b in range(len(seeds))]
 
 def get_avg_dist(embeddings, ing_emb):
 	return np.array([ut.euclidean_distance(ing_emb, e) for e in embeddings]).mean()
 
 
-def substitute_avoids(SW, ocn_emb, avoids, recipe):
+def substitute_avoids(SA, ocn_emb, avoids, recipe):
 	NoSubs = False
 	NewRecipe = []
 	for ingredient in recipe:
 		if not ingredient in avoids:
 			NewRecipe.append(ingredient)
 		else:
-			Ranked = []
-			for Edge, Weight in SW.iteritems():
-				if ingredient == Edge[0]:
-					Ranked.append((Weight, Edge[1]))
-				elif ingredient == Edge[1]:
-					Ranked.append((Weight, Edge[0]))
-			Ranked = sorted(Ranked, reverse=True)[:min(10, len(Ranked))]
+			Nbrs, Weights = ut.top_neighbors(SA, ingredient, 10)
+			Ranked = zip(Weights.tolist(), Nbrs.tolist())
 
 			if len(Ranked) == 0:
 				NoSubs = True
@@ -102,61 +142,126 @@ def substitute_avoids(SW, ocn_emb, avoids, recipe):
 		print 'This recipe may contain avoid items because of a lack of substitutable ingredients'
 	return NewRecipe
 
-def main(analysis=False):
-	# Load mappings and embeddings for specified network(s)
-	mappings = ut.load_mappings()
-	embeddings = ut.load_embeddings()
-	# Extract IIDs for specified seed ingredients
-	ingredient_to_iid = {ingredient:iid for iid, ingredient in mappings['IID_to_Ingredient_Mapping'].iteritems()}
-	if args.seed_ingredients is not None:
-		args.seed_ingredients = [ingredient_to_iid[ingredient] for ingredient in args.seed_ingredients]
+##############################################
+############## Recipe Generator ##############
+##############################################
+
+# Loads the mappings and embeddings once and generates any number of recipes from them
+class RecipeGenerator():
+	def __init__(self):
+		self.mappings = ut.load_mappings()
+		self.embeddings = ut.load_embeddings()
+		self.iid_to_ingredient = self.mappings['IID_to_Ingredient_Mapping']
+		self.ingredient_to_iid = {ingredient:iid for iid, ingredient in self.iid_to_ingredient.iteritems()}
+		self.substitution_adjacency = None
+		# Rows of every cuisine in every network (rebuilt if they have not been saved yet)
+		if os.path.exists(ut.cuisine_rows_file):
+			self.cuisine_rows = ut.load_cuisine_rows()
+		else:
+			self.cuisine_rows = ut.build_cuisine_rows(self.embeddings, self.iid_to_ingredient, \
+										self.mappings['Cuisine_to_List_of_Ingredients_Mapping'])
+		self.cuisine_embeddings = {}
+
+	# Resolve the 'random' cuisine to a randomly chosen one
+	def choose_cuisine(self, cuisine):
+		if cuisine == 'random':
+			return np.random.choice(self.mappings['Cuisine_to_List_of_Ingredients_Mapping'].keys())
+		return cuisine
+
+	# The embeddings of a network restricted to the ingredients of a cuisine (built once per cuisine)
+	def get_embeddings(self, network, cuisine=None):
+		if cuisine is None:
+			return self.embeddings[network]
+		if (network, cuisine) not in self.cuisine_rows:
+			raise KeyError(cuisine)
+		if (network, cuisine) not in self.cuisine_embeddings:
+			self.cuisine_embeddings[(network, cuisine)] = self.embeddings[network].take(self.cuisine_rows[(network, cuisine)])
+		return self.cuisine_embeddings[(network, cuisine)]
+
+	def get_substitution_adjacency(self):
+		if self.substitution_adjacency is None:
+			self.substitution_adjacency = ut.load_sn_adjacency()
+		return self.substitution_adjacency
+
+	# Check the generation options and extract IIDs for the seed ingredients
+	def check_options(self, seeds, network, minimum, accent):
+		if accent > 0 and not network == 'ocn_fph':
+			raise ValueError('You set accent > 1 but did not use network \'ocn_fph\'.')
+		if accent > minimum:
+			raise ValueError('Number of accent ingredients cannot be greater than the minimum number of ingredients.')
+		if network not in ['ocn_fph', 'ucn']:
+			raise NotImplementedError
+		if seeds is None:
+			return None
+		return [self.ingredient_to_iid[ingredient] for ingredient in seeds]
+
+	# Replace the avoided ingredients of a recipe with substitutes
+	def substitute(self, recipe, cuisine, avoids):
+		if avoids is None:
+			return recipe.tolist()
+		avoid_iids = [self.ingredient_to_iid[a] for a in avoids]
+		return substitute_avoids(self.get_substitution_adjacency(), self.get_embeddings('ocn', cuisine), avoid_iids, recipe.tolist())
 
-	if args.accent > 0 and not args.network == 'ocn_fph':
-		raise Exception('You set accent > 1 but did not use network \'ocn_fph\'.')
+	# Generate a single recipe (a list of IIds)
+	def generate(self, seeds=None, cuisine=None, network='ucn', minimum=7, maximum=7, accent=0, avoids=None):
+		return self.generate_many(1, seeds, cuisine, network, minimum, maximum, accent, avoids, vectorize=False)[0]
 
-	num_ingredients = np.random.randint(args.min, args.max+1)
-	if args.accent > args.min:
-		raise Exception('Number of accent ingredients cannot be greater than the minimum number of ingredients.')
+	# Generate n recipes (lists of IIds). A 'random' cuisine is chosen per recipe. With vectorize, recipes of
+	# the same cuisine are generated together, one distance matrix per step for the whole batch.
+	def generate_many(self, n, seeds=None, cuisine=None, network='ucn', minimum=7, maximum=7, accent=0, avoids=None, vectorize=True):
+		seed_iids = self.check_options(seeds, network, minimum, accent)
+		cuisines = [self.choose_cuisine(cuisine) for _ in range(n)]
+		num_ingredients = np.random.randint(minimum, maximum+1, size=n)
 
+		recipes = [None] * n
+		for c in sorted(set(cuisines), key=cuisines.index):
+			batch = [i for i in range(n) if cuisines[i] == c]
+			if network == 'ocn_fph':
+				ocn_embeddings, fph_embeddings = self.get_embeddings('ocn', c), self.get_embeddings('fph', c)
+			else:
+				ucn_embeddings = self.get_embeddings('ucn', c)
+
+			if vectorize:
+				if network == 'ocn_fph':
+					seed_sets = [choose_random_seed(ocn_embeddings, 2) if seed_iids is None else seed_iids for _ in batch]
+					# Sample Base Ingredients First, then Accent Ingredients using the Base Recipes
+					base_recipes = generate_batch(ocn_embeddings, seed_sets, num_ingredients[batch] - accent)
+					generated = generate_batch(fph_embeddings, base_recipes, num_ingredients[batch])
+				else:
+					seed_sets = [choose_random_seed(ucn_embeddings, 2) if seed_iids is None else seed_iids for _ in batch]
+					generated = generate_batch(ucn_embeddings, seed_sets, num_ingredients[batch])
+			elif network == 'ocn_fph':
+				generated = [base_accent_generate(ocn_embeddings, fph_embeddings, seed_iids, num_ingredients[i], accent) for i in batch]
+			else:
+				generated = [generate(ucn_embeddings, seed_iids, num_ingredients[i]) for i in batch]
+
+			for i, recipe in zip(batch, generated):
+				recipes[i] = self.substitute(recipe, c, avoids)
+		return recipes
+
+def main():
+	generator = RecipeGenerator()
+	cuisine = generator.choose_cuisine(args.cuisine)
 	if args.cuisine == 'random':
-		cuisine = np.random.choice(mappings['Cuisine_to_List_of_Ingredients_Mapping'].keys())
 		print 'Randomly Chosen Cuisine: {}'.format(cuisine)
-	else:
-		cuisine = args.cuisine
-
-	if args.network == 'ocn_fph':
-		recipe = base_accent_generate(get_embeddings(embeddings, 'ocn', mappings, cuisine), \
-										get_embeddings(embeddings, 'fph', mappings, cuisine), args.seed_ingredients, num_ingredients, args.accent)
-	elif args.network == 'ucn':
-		recipe = generate(get_embeddings(embeddings, 'ucn', mappings, cuisine), args.seed_ingredients, num_ingredients)
-	else:
-		raise NotImplementedError
-
-	if args.avoids is not None:
-		avoid_iids = [ingredient_to_iid[a] for a in args.avoids]
-		SN, SW = ut.load_sn()
-		recipe = substitute_avoids(SW, \
-										get_embeddings(embeddings, 'ocn', mappings, cuisine), avoid_iids, recipe)
-
-	if analysis:
-		return recipe
-
-	base_ingredients = num_ingredients - args.accent
+
+	recipe = generator.generate(args.seed_ingredients, cuisine, args.network, args.min, args.max, args.accent, args.avoids)
+
+	base_ingredients = len(recipe) - args.accent
 	for i, iid in enumerate(recipe):
 		if args.network == 'ocn_fph' and i >= base_ingredients:
-			print mappings['IID_to_Ingredient_Mapping'][iid], '(accent)'
+			print generator.iid_to_ingredient[iid], '(accent)'
 		else:
-			print mappings['IID_to_Ingredient_Mapping'][iid]
+			print generator.iid_to_ingredient[iid]
 
+# Generate a single recipe with a generator shared across calls (loaded on first use)
+shared_generator = None
 def generate_recipe(seeds, cuisine, network, minimum, maximum, accent, avoids):
-	args.seed_ingredients = seeds
-	args.cuisine = cuisine
-	args.network = network
-	args.min = minimum
-	args.max = maximum
-	args.accent = accent
-	args.avoids = avoids
-	return main(analysis=True)
+	global shared_generator
+	if shared_generator is None:
+		shared_generator = RecipeGenerator()
+	return shared_generator.generate(seeds, cuisine, network, minimum, maximum, accent, avoids)
 
 if __name__ == '__main__':
+	args = parser.parse_args()
 	main()
\ No newline at end of file
@@ -1,15 +1,17 @@
 import utils as ut
-from generate import generate_recipe
+from generate import RecipeGenerator
 from itertools import combinations
+from matplotlib import pyplot as plt
 
 
 def main():
-	embeddings = ut.load_embeddings()
+	# Load mappings and embeddings once for every generated recipe
+	generator = RecipeGenerator()
+	embeddings = generator.embeddings
 	# Graph for OCN
 	X = range(1, 31)
 	Y = []
-	for _ in X:
-	    recipe = generate_recipe(seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=0, avoids=None)
+	for recipe in generator.generate_many(len(X), seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=0, avoids=None):
 	    # Calculate pairwise distance
 	    Total = []
 	    for iid_1, iid_2 in combinations(recipe, 2):
@@ -20,8 +22,7 @@ def main():
 	# Graph for FPH
 	X = range(1, 31)
 	Y = []
-	for _ in X:
-	    recipe = generate_recipe(seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=7, avoids=None)
+	for recipe in generator.generate_many(len(X), seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=7, avoids=None):
 	    # Calculate pairwise distance
 	    Total = []
 	    for iid_1, iid_2 in combinations(recipe, 2):
@@ -32,8 +33,7 @@ def main():
 	# Graph for OCN_FPH
 	X = range(1, 31)
 	Y = []
-	for _ in X:
-	    recipe = generate_recipe(seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=3, avoids=None)
+	for recipe in generator.generate_many(len(X), seeds=None, cuisine=None, network='ocn_fph', minimum=7, maximum=7, accent=3, avoids=None):
 	    # Calculate pairwise distance
 	    Total = []
 	    for iid_1, iid_2 in combinations(recipe, 2):
@@ -44,8 +44,7 @@ def main():
 	# Graph for UCN
 	X = range(1, 31)
 	Y = []
-	for _ in X:
-	    recipe = generate_recipe(seeds=None, cuisine=None, network='ucn', minimum=7, maximum=7, accent=0, avoids=None)
+	for recipe in generator.generate_many(len(X), seeds=None, cuisine=None, network='ucn', minimum=7, maximum=7, accent=0, avoids=None):
 	    # Calculate pairwise distance
 	    Total = []
 	    for iid_1, iid_2 in combinations(recipe, 2):
@@ -0,0 +1,73 @@
+import numpy as np
+import multiprocessing
+
+##############################################
+########## Upper-Triangular Chunking #########
+##############################################
+
+# Index of the first pair (i, i+1) of row i in the flattened upper triangle of N nodes
+def row_starts(N):
+    Rows = np.arange(N + 1, dtype=np.int64)
+    return Rows * N - Rows * (Rows + 1) // 2
+
+# Split the N*(N-1)/2 pairs of N nodes into NumChunks contiguous [Start, End) ranges of (almost) equal size
+def balanced_chunks(N, NumChunks):
+    NumPairs = N * (N - 1) // 2
+    NumChunks = max(1, min(NumChunks, NumPairs))
+    Bounds = [NumPairs * k // NumChunks for k in range(NumChunks + 1)]
+    return [(Bounds[k], Bounds[k+1]) for k in range(NumChunks) if Bounds[k] < Bounds[k+1]]
+
+##############################################
+########### Parallel Pair Scoring ############
+##############################################
+
+# Metric, graphs, parameters and node ids shared with the worker processes. Snap graphs cannot be
+# pickled, so this is set before the pool is created and inherited by the forked workers.
+_State = None
+
+# Score every pair in the [Start, End) range of the flattened upper triangle with the shared metric
+def score_chunk(Chunk):
+    Metric, Graphs, Params, NIds, Starts = _State
+    Start, End = Chunk
+    N = len(NIds)
+    i = int(np.searchsorted(Starts, Start, side='right')) - 1
+    j = i + 1 + (Start - Starts[i])
+    AIIds, BIIds, Weights = [], [], []
+    for _ in xrange(End - Start):
+        B, W = Metric(*(Graphs + (NIds[i], NIds[j]) + Params))
+        if B:
+            AIIds.append(NIds[i])
+            BIIds.append(NIds[j])
+            Weights.append(W)
+        j += 1
+        if j == N:
+            i += 1
+            j = i + 1
+    return AIIds, BIIds, Weights
+
+# Score all pairs of NIds with a utils-style pair metric, Metric(*Graphs, AIId, BIId, *Params) -> (B, W)
+# (e.g. ut.PMI with Graphs=(IRG,) and Params=(NR, Threshold), or ut.SF with Graphs=(IFG, IRG)).
+# Pairs are split into balanced chunks, scored on Workers processes (all cores by default) and merged
+# back in chunk order, so the (AIIds, BIIds, Weights) arrays are the same for any number of workers.
+def score_pairs(Metric, NIds, Graphs, Params=(), Workers=None, ChunksPerWorker=4):
+    global _State
+    Workers = Workers or multiprocessing.cpu_count()
+    NIds = list(NIds)
+    Chunks = balanced_chunks(len(NIds), Workers * ChunksPerWorker)
+    _State = (Metric, tuple(Graphs), tuple(Params), NIds, row_starts(len(NIds)))
+    try:
+        if Workers == 1:
+            Results = map(score_chunk, Chunks)
+        else:
+            Pool = multiprocessing.Pool(Workers)
+            try:
+                Results = Pool.map(score_chunk, Chunks, chunksize=1)
+            finally:
+                Pool.close()
+                Pool.join()
+    finally:
+        _State = None
+    AIIds = np.array([AIId for Result in Results for AIId in Result[0]], dtype=np.int64)
+    BIIds = np.array([BIId for Result in Results for BIId in Result[1]], dtype=np.int64)
+    Weights = np.array([W for Result in Results for W in Result[2]], dtype=np.float64)
+    return AIIds, BIIds, Weights
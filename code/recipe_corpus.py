@@ -0,0 +1,160 @@
+import numpy as np
+import collections
+import os
+
+##############################################
+########### Columnar Recipe Corpus ###########
+##############################################
+
+# The recipe corpus is stored as flat arrays in one .npy file each (memory mapped on load):
+#   RIds:            sorted recipe ids (int32)
+#   Offsets:         the ingredients of recipe RIds[i] are Ingredients[Offsets[i]:Offsets[i+1]] (int64)
+#   Ingredients:     ingredient ids of every recipe, one after the other (int32)
+#   Cuisines:        cuisine code of every recipe (int8, or int16 for more than 127 cuisines)
+#   CuisineNames:    name of each cuisine code
+#   IngredientNames: name of each ingredient id
+corpus_dir = '../data/corpus'
+corpus_arrays = ['RIds', 'Offsets', 'Ingredients', 'Cuisines', 'CuisineNames', 'IngredientNames']
+
+# Path of each corpus array file (or of the given arrays only)
+def corpus_files(dirname=corpus_dir, names=corpus_arrays):
+    return [os.path.join(dirname, name + '.npy') for name in names]
+
+# Mappings that are served as views over the corpus instead of being pickled
+view_names = [
+    'RID_to_List_of_Ingredients_Mapping',
+    'RID_to_Cuisine_Mappings',
+    'Cuisine_to_List_of_RIDs_Mapping'
+]
+
+# Corpus arrays each view reads
+view_arrays = {
+    'RID_to_List_of_Ingredients_Mapping': ['RIds', 'Offsets', 'Ingredients', 'IngredientNames'],
+    'RID_to_Cuisine_Mappings': ['RIds', 'Cuisines', 'CuisineNames'],
+    'Cuisine_to_List_of_RIDs_Mapping': ['RIds', 'Cuisines', 'CuisineNames']
+}
+
+class RecipeCorpus():
+    def __init__(self, RIds, Offsets, Ingredients, Cuisines, CuisineNames, IngredientNames):
+        self.RIds = RIds
+        self.Offsets = Offsets
+        self.Ingredients = Ingredients
+        self.Cuisines = Cuisines
+        self.CuisineNames = CuisineNames
+        self.IngredientNames = IngredientNames
+
+    # Build the corpus from the recipe mappings produced by data_prep
+    @classmethod
+    def from_mappings(cls, rid_to_ingredients, rid_to_cuisine, iid_to_ingredient):
+        ingredient_to_iid = {ingredient:iid for iid, ingredient in iid_to_ingredient.iteritems()}
+        RIds = np.array(sorted(rid_to_ingredients.keys()), dtype=np.int32)
+        Sizes = [len(rid_to_ingredients[RId]) for RId in RIds.tolist()]
+        Offsets = np.concatenate([[0], np.cumsum(Sizes)]).astype(np.int64)
+        Ingredients = np.array([ingredient_to_iid[ingredient] for RId in RIds.tolist() for ingredient in rid_to_ingredients[RId]], dtype=np.int32)
+        CuisineNames = np.array(sorted(set(rid_to_cuisine.values())))
+        Codes = {Cuisine:Code for Code, Cuisine in enumerate(CuisineNames.tolist())}
+        Cuisines = np.array([Codes[rid_to_cuisine[RId]] for RId in RIds.tolist()], dtype=np.int8 if len(CuisineNames) < 128 else np.int16)
+        IngredientNames = np.array([iid_to_ingredient.get(IId, '') for IId in range(max(iid_to_ingredient.keys()) + 1)])
+        return cls(RIds, Offsets, Ingredients, Cuisines, CuisineNames, IngredientNames)
+
+    def save(self, dirname=corpus_dir):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        for name, filename in zip(corpus_arrays, corpus_files(dirname)):
+            np.save(filename, getattr(self, name))
+
+    # Open a saved corpus without reading it into memory
+    @classmethod
+    def load(cls, dirname=corpus_dir):
+        return cls(*[np.load(filename, mmap_mode='r') for filename in corpus_files(dirname)])
+
+    @staticmethod
+    def exists(dirname=corpus_dir):
+        return all(os.path.exists(filename) for filename in corpus_files(dirname))
+
+    # Total size in bytes of the saved corpus files (or of the given arrays only)
+    @staticmethod
+    def size(dirname=corpus_dir, names=corpus_arrays):
+        return sum(os.path.getsize(filename) for filename in corpus_files(dirname, names))
+
+    # Index of a recipe in the arrays
+    def row(self, RId):
+        Row = np.searchsorted(self.RIds, RId)
+        if Row == len(self.RIds) or self.RIds[Row] != RId: raise KeyError(RId)
+        return Row
+
+    # Ingredient ids of a recipe
+    def ingredients(self, RId):
+        Row = self.row(RId)
+        return self.Ingredients[self.Offsets[Row]:self.Offsets[Row+1]]
+
+    # Number of ingredients in every recipe
+    def recipe_sizes(self):
+        return np.diff(self.Offsets)
+
+    # Number of recipes of every cuisine (indexed by cuisine code)
+    def cuisine_counts(self):
+        return np.bincount(self.Cuisines, minlength=len(self.CuisineNames))
+
+    # Number of recipes using every ingredient (indexed by IId), optionally only within one cuisine
+    def ingredient_counts(self, cuisine=None):
+        Ingredients = self.Ingredients
+        if cuisine is not None:
+            Code = self.CuisineNames.tolist().index(cuisine)
+            Ingredients = Ingredients[np.repeat(self.Cuisines == Code, self.recipe_sizes())]
+        return np.bincount(Ingredients, minlength=len(self.IngredientNames))
+
+    # The pickled mapping a view stands in for
+    def view(self, name):
+        if name == 'RID_to_List_of_Ingredients_Mapping': return RecipeIngredientsView(self)
+        if name == 'RID_to_Cuisine_Mappings': return RecipeCuisineView(self)
+        if name == 'Cuisine_to_List_of_RIDs_Mapping': return CuisineRecipesView(self)
+        raise KeyError(name)
+
+##############################################
+############ Corpus Mapping Views ############
+##############################################
+
+# RID to List of Ingredients Mapping (ingredient names)
+class RecipeIngredientsView(collections.Mapping):
+    def __init__(self, Corpus):
+        self.Corpus = Corpus
+
+    def __getitem__(self, RId):
+        return self.Corpus.IngredientNames[self.Corpus.ingredients(RId)].tolist()
+
+    def __iter__(self):
+        return iter(self.Corpus.RIds.tolist())
+
+    def __len__(self):
+        return len(self.Corpus.RIds)
+
+# RID to Cuisine Mapping
+class RecipeCuisineView(collections.Mapping):
+    def __init__(self, Corpus):
+        self.Corpus = Corpus
+
+    def __getitem__(self, RId):
+        return str(self.Corpus.CuisineNames[self.Corpus.Cuisines[self.Corpus.row(RId)]])
+
+    def __iter__(self):
+        return iter(self.Corpus.RIds.tolist())
+
+    def __len__(self):
+        return len(self.Corpus.RIds)
+
+# Cuisine to List of RIDs Mapping
+class CuisineRecipesView(collections.Mapping):
+    def __init__(self, Corpus):
+        self.Corpus = Corpus
+
+    def __getitem__(self, cuisine):
+        Names = self.Corpus.CuisineNames.tolist()
+        if cuisine not in Names: raise KeyError(cuisine)
+        return self.Corpus.RIds[self.Corpus.Cuisines == Names.index(cuisine)].tolist()
+
+    def __iter__(self):
+        return iter(self.Corpus.CuisineNames.tolist())
+
+    def __len__(self):
+        return len(self.Corpus.CuisineNames)
@@ -0,0 +1,99 @@
+import argparse
+import json
+import traceback
+import urlparse
+import BaseHTTPServer
+import SocketServer
+import utils as ut
+from generate import RecipeGenerator
+
+parser = argparse.ArgumentParser(description="Serve recipe generation and substitution over HTTP.")
+parser.add_argument('--host',             type=str,          default='127.0.0.1',    help="Address to listen on")
+parser.add_argument('--port',             type=int,          default=8000,           help="Port to listen on")
+
+# Mappings, embeddings and the substitution adjacency, loaded once and shared by every request
+generator = None
+
+# Parse an integer query parameter
+def get_int(query, name, default):
+	return int(query[name][0]) if name in query else default
+
+# Generate recipes: /generate?seed=..&cuisine=..&network=..&min=..&max=..&accent=..&avoid=..&n=..
+# (seed and avoid may be repeated, cuisine may be 'random')
+def handle_generate(query):
+	cuisine = generator.choose_cuisine(query.get('cuisine', [None])[0])
+	network = query.get('network', ['ucn'])[0]
+	accent = get_int(query, 'accent', 0)
+	recipes = generator.generate_many(get_int(query, 'n', 1), query.get('seed'), cuisine, network, \
+										get_int(query, 'min', 7), get_int(query, 'max', 7), accent, query.get('avoid'))
+	return {
+		'cuisine': cuisine,
+		'network': network,
+		'accent': accent,
+		'recipes': [[generator.iid_to_ingredient[iid] for iid in recipe] for recipe in recipes]
+	}
+
+# Substitutes for ingredients: /substitute?ingredient=..&k=.. (ingredient may be repeated)
+def handle_substitute(query):
+	k = get_int(query, 'k', 5)
+	if k < 1:
+		raise ValueError('k must be greater than 0')
+	substitutes = {}
+	for ingredient in query.get('ingredient', []):
+		Nbrs, Weights = ut.top_neighbors(generator.get_substitution_adjacency(), generator.ingredient_to_iid[ingredient], k)
+		substitutes[ingredient] = [{'ingredient': generator.iid_to_ingredient[IId], 'weight': Weight} \
+										for IId, Weight in zip(Nbrs.tolist(), Weights.tolist())]
+	return {'substitutes': substitutes}
+
+handlers = {
+	'/generate': handle_generate,
+	'/substitute': handle_substitute
+}
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def do_GET(self):
+		url = urlparse.urlparse(self.path)
+		if url.path not in handlers:
+			return self.respond(404, {'error': 'Unknown endpoint {}'.format(url.path)})
+		try:
+			response = handlers[url.path](urlparse.parse_qs(url.query))
+		except KeyError as e:
+			return self.respond(400, {'error': 'Unknown ingredient or cuisine: {}'.format(e.args[0])})
+		except NotImplementedError:
+			return self.respond(400, {'error': 'Unsupported network'})
+		except ValueError as e:
+			return self.respond(400, {'error': str(e)})
+		except Exception:
+			self.log_error('%s', traceback.format_exc())
+			return self.respond(500, {'error': 'Internal server error'})
+		self.respond(200, response)
+
+	def respond(self, status, body):
+		body = json.dumps(body)
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+# Handle each request on its own thread
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+def main():
+	global generator
+	print 'Loading mappings and embeddings...'
+	generator = RecipeGenerator()
+	generator.get_substitution_adjacency()
+	generator.mappings.report()
+	server = Server((args.host, args.port), RequestHandler)
+	print 'Serving on http://{}:{}'.format(args.host, args.port)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+if __name__ == '__main__':
+	args = parser.parse_args()
+	main()
@@ -14,7 +14,7 @@ if args.k < 1:
 def main():
 	# Load mappings and embeddings for specified network(s)
 	mappings = ut.load_mappings()
-	SN, SW = ut.load_sn()
+	SA = ut.load_sn_adjacency()
 
 	iid_to_ingredient = mappings['IID_to_Ingredient_Mapping']
 	ingredient_to_iid = {ingredient:iid for iid, ingredient in iid_to_ingredient.iteritems()}
@@ -22,15 +22,10 @@ def main():
 		print '#' * 80
 		print 'Substitutes for ingredient: {}'.format(ingredient)
 		print '#' * 80
-		substitutes = []
-		for Edge, Weight in SW.iteritems():
-			if ingredient_to_iid[ingredient] == Edge[0]:
-				substitutes.append((Weight, Edge[1]))
-			elif ingredient_to_iid[ingredient] == Edge[1]:
-				substitutes.append((Weight, Edge[0]))
-		if len(substitutes) > 0:
-			Ranked = sorted(substitutes, reverse=True)[:args.k]
-			for i, (Weight, IId) in enumerate(Ranked):
+		# Substitutes are stored sorted by decreasing weight, so the top k are a slice
+		Nbrs, Weights = ut.top_neighbors(SA, ingredient_to_iid[ingredient], args.k)
+		if len(Nbrs) > 0:
+			for i, (IId, Weight) in enumerate(zip(Nbrs.tolist(), Weights.tolist())):
 				print '{}. {} ({})'.format(i+1, iid_to_ingredient[IId], Weight)
 		else:
 			print 'NO SUBSTITUTES (sorry...)'
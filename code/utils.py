@@ -3,6 +3,9 @@ import numpy as np
 import pandas as pd
 import collections
 import pickle
+import os
+import time
+import recipe_corpus as rc
 
 ##############################################
 ########## Graph Loading Functions ###########
@@ -23,16 +26,77 @@ mapping_names = [
     'Cuisine_to_Regions',
     'Region_to_Cuisines'
 ]
-# Load the dictionary of names to mappings
+# Load the dictionary of names to mappings (each mapping is unpickled on first access)
 def load_mappings():
-    mappings = {}
-    for name in mapping_names:
-        filename = '../data/mappings/{}.pkl'.format(name)
-        with open(filename, 'rb') as f:
-            mappings[name] = pickle.load(f)
-    return mappings
-
-# Load mappings for graph embeddings
+    return MappingRegistry(mapping_names)
+
+def mapping_file(name):
+    return '../data/mappings/{}.pkl'.format(name)
+
+# Dictionary of a fixed set of names whose values are only loaded (by load) when first accessed
+class LazyStore():
+    def __init__(self, names):
+        self.names = list(names)
+        self.loaded = {}
+
+    def __getitem__(self, name):
+        if name not in self.names: raise KeyError(name)
+        if name not in self.loaded:
+            self.loaded[name] = self.load(name)
+        return self.loaded[name]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def iteritems(self):
+        return ((name, self[name]) for name in self.names)
+
+# Lazy dictionary of mapping name to mapping that records the load time and file size of each mapping.
+# The recipe mappings are views over the memory mapped recipe corpus when it has been built.
+class MappingRegistry(LazyStore):
+    def __init__(self, names):
+        LazyStore.__init__(self, names)
+        self.load_times = {}
+        self.sizes = {}
+        self.corpus = None
+
+    def load(self, name):
+        Start = time.time()
+        if name in rc.view_names and rc.RecipeCorpus.exists():
+            mapping = self.get_corpus().view(name)
+            self.sizes[name] = rc.RecipeCorpus.size(names=rc.view_arrays[name])
+        else:
+            with open(mapping_file(name), 'rb') as f:
+                mapping = pickle.load(f)
+            self.sizes[name] = os.path.getsize(mapping_file(name))
+        self.load_times[name] = time.time() - Start
+        return mapping
+
+    # The recipe corpus shared by all of the recipe mapping views
+    def get_corpus(self):
+        if self.corpus is None:
+            self.corpus = rc.RecipeCorpus.load()
+        return self.corpus
+
+    # (name, load time in seconds, file size in bytes) of every mapping loaded so far
+    def stats(self):
+        return [(name, self.load_times[name], self.sizes[name]) for name in self.names if name in self.loaded]
+
+    def report(self):
+        print 'Loaded Mappings:'
+        for name, seconds, size in self.stats():
+            print '{:<40} {:>8.3f}s {:>10.1f}KB'.format(name, seconds, size / 1024.0)
+
+# Load the graph embeddings of every network (each network is memory mapped on first access)
 embedding_names = [
     'ocn',
     'fph',
@@ -40,13 +104,27 @@ embedding_names = [
     'sn'
 ]
 def load_embeddings():
-    mappings = {}
-    for name in embedding_names:
-        filename = '../data/mappings/{}_emb_map.pkl'.format(name)
-        with open(filename, 'rb') as f:
-            mappings[name] = pickle.load(f)
-    return mappings
-            
+    return EmbeddingStore(embedding_names)
+
+# Binary embedding store of a network: a float32 matrix and the sorted IId of each of its rows
+embeddings_dir = '../data/embeddings'
+def embedding_files(name):
+    return '{}/{}.npy'.format(embeddings_dir, name), '{}/{}_ids.npy'.format(embeddings_dir, name)
+
+# Open the embedding store of a network without reading it into memory
+def load_embedding_matrix(name):
+    vectors_file, ids_file = embedding_files(name)
+    return EmbeddingMatrix(np.load(ids_file), np.load(vectors_file, mmap_mode='r'))
+
+# Write the embedding store of a network from its node ids and the embedding of each node
+def save_embedding_matrix(name, IIds, Vectors):
+    if not os.path.exists(embeddings_dir):
+        os.makedirs(embeddings_dir)
+    Order = np.argsort(IIds, kind='mergesort')
+    vectors_file, ids_file = embedding_files(name)
+    np.save(vectors_file, np.ascontiguousarray(np.asarray(Vectors, dtype=np.float32)[Order]))
+    np.save(ids_file, np.asarray(IIds, dtype=np.int64)[Order])
+
 # Load an undirected graph from a binary file
 def load_graph(filename):
     FIn = snap.TFIn(filename)
@@ -57,6 +135,10 @@ def load_weights(filename):
     with open(filename, 'rb') as f:
         return pickle.load(f)
 
+# Load a pickled Weights Dictionary as WeightedEdges
+def load_weighted_edges(filename):
+    return WeightedEdges.from_dict(load_weights(filename))
+
 ingredient_flavor_graph_file = '../data/graphs/ingredient_flavor.graph'
 ingredient_recipe_graph_file = '../data/graphs/ingredient_recipe.graph'
 # Load the Ingredient-Flavor and Ingredient-Recipe Graphs and the data mappings
@@ -67,25 +149,291 @@ def load_basic_graphs():
 ocn_graph_file = '../data/graphs/ocn.graph'
 ocn_weights_file = '../data/weights/ocn_weights.pkl'
 def load_ocn():
-    return load_graph(ocn_graph_file), load_weights(ocn_weights_file) 
+    return load_graph(ocn_graph_file), load_weighted_edges(ocn_weights_file)
 
 # Load the Food Pairing Hypothesis Network
 fph_graph_file = '../data/graphs/fph.graph'
 fph_weights_file = '../data/weights/fph_weights.pkl'
 def load_fph():
-    return load_graph(fph_graph_file), load_weights(fph_weights_file)
+    return load_graph(fph_graph_file), load_weighted_edges(fph_weights_file)
 
 # Load the Updated Complement Network
 ucn_graph_file = '../data/graphs/ucn.graph'
 ucn_weights_file = '../data/weights/ucn_weights.pkl'
 def load_ucn():
-    return load_graph(ucn_graph_file), load_weights(ucn_weights_file)
+    return load_graph(ucn_graph_file), load_weighted_edges(ucn_weights_file)
 
 # Load the Substitution Network
 sn_graph_file = '../data/graphs/sn.graph'
 sn_weights_file = '../data/weights/sn_weights.pkl'
 def load_sn():
-    return load_graph(sn_graph_file), load_weights(sn_weights_file) 
+    return load_graph(sn_graph_file), load_weighted_edges(sn_weights_file)
+
+# Load the Substitution Network as a per-ingredient adjacency sorted by decreasing weight
+# (built from the weights dictionary if the adjacency file has not been written yet)
+sn_adjacency_file = '../data/weights/sn_adjacency.npz'
+def load_sn_adjacency():
+    if not os.path.exists(sn_adjacency_file):
+        return build_adjacency(load_weights(sn_weights_file))
+    return load_adjacency(sn_adjacency_file)
+
+##############################################
+############# Weighted Adjacency #############
+##############################################
+
+# CSR-style adjacency of a weighted network: the neighbors of NIds[i] are Nbrs[Offsets[i]:Offsets[i+1]]
+# with weights Weights[Offsets[i]:Offsets[i+1]], sorted by decreasing weight (ties by decreasing id)
+Adjacency = collections.namedtuple('Adjacency', ['NIds', 'Offsets', 'Nbrs', 'Weights'])
+
+# Build the adjacency of a network from its dictionary of (AIId, BIId) edge weights
+def build_adjacency(Weights):
+    Edges = np.array(Weights.keys(), dtype=np.int64).reshape(-1, 2)
+    return adjacency_from_edges(Edges[:, 0], Edges[:, 1], np.array(Weights.values(), dtype=np.float64))
+
+# Build the adjacency of a network from arrays of its (undirected) edges and their weights
+def adjacency_from_edges(AIIds, BIIds, W):
+    AIIds, BIIds = np.asarray(AIIds, dtype=np.int64), np.asarray(BIIds, dtype=np.int64)
+    # Every undirected edge is a neighbor entry for both of its endpoints
+    Src = np.concatenate([AIIds, BIIds])
+    Dst = np.concatenate([BIIds, AIIds])
+    W = np.concatenate([W, W])
+    Order = np.lexsort((-Dst, -W, Src))
+    NIds = np.unique(Src)
+    Counts = np.bincount(np.searchsorted(NIds, Src), minlength=len(NIds))
+    Offsets = np.concatenate([[0], np.cumsum(Counts)]).astype(np.int64)
+    return Adjacency(NIds.astype(np.int32), Offsets, Dst[Order].astype(np.int32), W[Order])
+
+# Load an adjacency saved with numpy's savez
+def load_adjacency(filename):
+    with np.load(filename) as f:
+        return Adjacency(*[f[Field] for Field in Adjacency._fields])
+
+# The (at most k) highest weighted neighbors of NId as (Nbrs, Weights) arrays
+def top_neighbors(A, NId, k=None):
+    Row = np.searchsorted(A.NIds, NId)
+    if Row == len(A.NIds) or A.NIds[Row] != NId:
+        return A.Nbrs[:0], A.Weights[:0]
+    Start, End = A.Offsets[Row], A.Offsets[Row+1]
+    if k is not None: End = min(End, Start + k)
+    return A.Nbrs[Start:End], A.Weights[Start:End]
+
+##############################################
+############### Weighted Edges ###############
+##############################################
+
+# Edge weights of an undirected network stored as (AIId, BIId) pairs with AIId < BIId sorted by AIId then
+# BIId (int32) and their weights (float64, the exact pickled weights). Pairs are looked up in either order
+# by binary search, and the dictionary operations used on the pickled weights (W[Edge], Edge in W, len,
+# keys, values, iteritems) are kept so WeightedEdges can be used in place of a Weights dictionary.
+class WeightedEdges():
+    def __init__(self, AIIds, BIIds, Weights):
+        AIIds, BIIds = np.asarray(AIIds, dtype=np.int64), np.asarray(BIIds, dtype=np.int64)
+        Lo, Hi = np.minimum(AIIds, BIIds), np.maximum(AIIds, BIIds)
+        Order = np.lexsort((Hi, Lo))
+        self.AIIds = Lo[Order].astype(np.int32)
+        self.BIIds = Hi[Order].astype(np.int32)
+        self.Weights = np.asarray(Weights, dtype=np.float64)[Order]
+        self.Keys = self.pair_keys(self.AIIds, self.BIIds)
+        self.adjacency = None
+
+    @classmethod
+    def from_dict(cls, Weights):
+        Edges = np.array(Weights.keys(), dtype=np.int64).reshape(-1, 2)
+        return cls(Edges[:, 0], Edges[:, 1], np.array(Weights.values(), dtype=np.float64))
+
+    # Order independent int64 key of each (AIId, BIId) pair
+    @staticmethod
+    def pair_keys(AIIds, BIIds):
+        AIIds, BIIds = np.asarray(AIIds, dtype=np.int64), np.asarray(BIIds, dtype=np.int64)
+        return (np.minimum(AIIds, BIIds) << 32) | np.maximum(AIIds, BIIds)
+
+    # Position of each pair in the arrays (-1 for pairs without an edge)
+    def index(self, AIIds, BIIds):
+        Query = self.pair_keys(AIIds, BIIds)
+        if len(self.Keys) == 0: return np.full(Query.shape, -1, dtype=np.int64)
+        Index = np.minimum(np.searchsorted(self.Keys, Query), len(self.Keys) - 1)
+        return np.where(self.Keys[Index] == Query, Index, -1)
+
+    # Weight of each pair (Default for pairs without an edge)
+    def lookup(self, AIIds, BIIds, Default=0.0):
+        Index = self.index(AIIds, BIIds)
+        return np.where(Index >= 0, self.Weights[np.maximum(Index, 0)], Default)
+
+    def __getitem__(self, Edge):
+        Index = int(self.index(Edge[0], Edge[1]))
+        if Index < 0: raise KeyError(Edge)
+        return float(self.Weights[Index])
+
+    def get(self, Edge, Default=None):
+        return self[Edge] if Edge in self else Default
+
+    def __contains__(self, Edge):
+        return int(self.index(Edge[0], Edge[1])) >= 0
+
+    def __len__(self):
+        return len(self.Keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return zip(self.AIIds.tolist(), self.BIIds.tolist())
+
+    def values(self):
+        return self.Weights.tolist()
+
+    def iteritems(self):
+        return iter(zip(self.keys(), self.values()))
+
+    # Weighted adjacency of the edges (see build_adjacency), built on first use
+    def get_adjacency(self):
+        if self.adjacency is None:
+            self.adjacency = adjacency_from_edges(self.AIIds, self.BIIds, self.Weights)
+        return self.adjacency
+
+    # Neighbors of NId and the weights of their edges as arrays sorted by decreasing weight (at most k of them)
+    def neighbors(self, NId, k=None):
+        return top_neighbors(self.get_adjacency(), NId, k)
+
+    # Every node with an edge and the sum of the weights of its edges (each shifted by Shift)
+    def weighted_degrees(self, Shift=0.0):
+        NIds = np.union1d(self.AIIds, self.BIIds)
+        W = self.Weights + Shift
+        Degrees = np.bincount(np.searchsorted(NIds, self.AIIds), weights=W, minlength=len(NIds)) + \
+                  np.bincount(np.searchsorted(NIds, self.BIIds), weights=W, minlength=len(NIds))
+        return NIds, Degrees
+
+    # The (AIIds, BIIds, Weights) arrays of the K highest weighted edges (lowest if not Reverse) among
+    # those whose endpoints are both in NIds (all edges by default), ties broken by the pair's ids
+    def top_edges(self, K, NIds=None, Reverse=True):
+        Index = np.arange(len(self.Keys))
+        if NIds is not None:
+            Index = Index[np.in1d(self.AIIds, NIds) & np.in1d(self.BIIds, NIds)]
+        Order = np.lexsort((self.BIIds[Index], self.AIIds[Index], self.Weights[Index]))
+        if Reverse: Order = Order[::-1]
+        Index = Index[Order[:K]]
+        return self.AIIds[Index], self.BIIds[Index], self.Weights[Index]
+
+##############################################
+############# Binary Edge Arrays #############
+##############################################
+
+# Binary form of a network written next to its snap graph: the id of every node (NIds, int32) and one
+# (Src, Dst, Weight) entry per undirected edge with Src < Dst (int32, int32, float32)
+EdgeArrays = collections.namedtuple('EdgeArrays', ['NIds', 'Src', 'Dst', 'Weights'])
+
+def edge_arrays_file(graph_filename):
+    return os.path.splitext(graph_filename)[0] + '_edges.npz'
+
+# Load edge arrays saved with numpy's savez
+def load_edge_arrays(filename):
+    with np.load(filename) as f:
+        return EdgeArrays(*[f[Field] for Field in EdgeArrays._fields])
+
+# Load the edge arrays of a network by name (built from its graph and weights if they have not been written yet)
+network_graph_files = {'ocn': ocn_graph_file, 'fph': fph_graph_file, 'ucn': ucn_graph_file, 'sn': sn_graph_file}
+network_loaders = {'ocn': load_ocn, 'fph': load_fph, 'ucn': load_ucn, 'sn': load_sn}
+def load_network_edges(name):
+    filename = edge_arrays_file(network_graph_files[name])
+    if not os.path.exists(filename):
+        return network_edge_arrays(*network_loaders[name]())
+    return load_edge_arrays(filename)
+
+# Edge arrays of a network's graph and weights dictionary
+def network_edge_arrays(G, Weights):
+    Edges = [(Edge.GetSrcNId(), Edge.GetDstNId()) for Edge in G.Edges()]
+    return EdgeArrays(np.array(sorted([NI.GetId() for NI in G.Nodes()]), dtype=np.int32),
+                      np.array([Src for Src, Dst in Edges], dtype=np.int32).reshape(-1),
+                      np.array([Dst for Src, Dst in Edges], dtype=np.int32).reshape(-1),
+                      np.array([Weights[Edge] for Edge in Edges], dtype=np.float32).reshape(-1))
+
+##############################################
+############# Embedding Matrices #############
+##############################################
+
+# The embeddings of a network held as one contiguous float32 matrix (row i embeds IIds[i]). It supports
+# the dictionary operations used on the embedding maps (E[IId], IId in E, len, keys, iteritems).
+class EmbeddingMatrix():
+    def __init__(self, IIds, Vectors):
+        self.IIds = np.asarray(IIds, dtype=np.int64)
+        self.Vectors = np.ascontiguousarray(Vectors, dtype=np.float32).reshape(len(self.IIds), -1)
+        self.Index = {IId:Row for Row, IId in enumerate(self.IIds.tolist())}
+
+    # Build from an embedding map of IId to embedding vector
+    @classmethod
+    def from_dict(cls, Embeddings):
+        IIds = sorted(Embeddings.keys())
+        return cls(IIds, [Embeddings[IId] for IId in IIds])
+
+    # Row numbers of the given IIds
+    def rows(self, IIds):
+        return np.array([self.Index[IId] for IId in IIds], dtype=np.int64)
+
+    # The embeddings in the given rows
+    def take(self, Rows):
+        return EmbeddingMatrix(self.IIds[Rows], self.Vectors[Rows])
+
+    def __getitem__(self, IId):
+        return self.Vectors[self.Index[IId]]
+
+    def __contains__(self, IId):
+        return IId in self.Index
+
+    def __len__(self):
+        return len(self.IIds)
+
+    def keys(self):
+        return self.IIds.tolist()
+
+    def iteritems(self):
+        return ((IId, self.Vectors[Row]) for Row, IId in enumerate(self.IIds.tolist()))
+
+# Dictionary of network name to EmbeddingMatrix that opens each network's store on first access
+class EmbeddingStore(LazyStore):
+    def load(self, name):
+        return load_embedding_matrix(name)
+
+# Rows of each cuisine's ingredients in the embedding matrix of each network, keyed by (network, cuisine)
+def build_cuisine_rows(embeddings, iid_to_ingredient, cuisine_to_ingredients):
+    ingredient_to_iid = {ingredient:iid for iid, ingredient in iid_to_ingredient.iteritems()}
+    CuisineRows = {}
+    for cuisine, ingredients in cuisine_to_ingredients.iteritems():
+        IIds = [ingredient_to_iid[ingredient] for ingredient in ingredients]
+        for network, E in embeddings.iteritems():
+            CuisineRows[(network, cuisine)] = np.flatnonzero(np.in1d(E.IIds, IIds))
+    return CuisineRows
+
+# Load the per-cuisine rows saved by save_cuisine_rows (saved under 'network:cuisine' keys)
+cuisine_rows_file = '../data/mappings/cuisine_rows.npz'
+def load_cuisine_rows():
+    with np.load(cuisine_rows_file) as f:
+        return {tuple(Key.split(':', 1)):f[Key] for Key in f.files}
+
+# Precompute and save the per-cuisine rows of the current embedding stores
+def save_cuisine_rows():
+    mappings = load_mappings()
+    CuisineRows = build_cuisine_rows(load_embeddings(), mappings['IID_to_Ingredient_Mapping'], mappings['Cuisine_to_List_of_Ingredients_Mapping'])
+    with open(cuisine_rows_file, 'wb') as f:
+        np.savez(f, **{'{}:{}'.format(network, cuisine):Rows for (network, cuisine), Rows in CuisineRows.iteritems()})
+
+##############################################
+############### Neighbor Index ###############
+##############################################
+
+# Frozen neighbor sets and degrees of every node in a graph, built once so that repeated pair metrics
+# become set lookups. Every function below accepts an index in place of the raw TUNGraph, and any other
+# graph method (IsNode, Nodes, GetNI, ...) is forwarded to the underlying graph.
+class NeighborIndex():
+    def __init__(self, G):
+        self.G = G
+        self.Nbrs = {}
+        self.Degrees = {}
+        for NI in G.Nodes():
+            self.Nbrs[NI.GetId()] = frozenset(NI.GetOutEdges())
+            self.Degrees[NI.GetId()] = NI.GetDeg()
+
+    def __getattr__(self, name):
+        return getattr(self.G, name)
 
 ##############################################
 ############# General Functions ##############
@@ -95,8 +443,13 @@ def euclidean_distance(X, Y):
   return np.sqrt(((X - Y) ** 2).sum())
 
 def get_nbr_set(G, NId):
+    if isinstance(G, NeighborIndex): return G.Nbrs[NId]
     return set([Nbr for Nbr in G.GetNI(NId).GetOutEdges()])
 
+def get_degree(G, NId):
+    if isinstance(G, NeighborIndex): return G.Degrees[NId]
+    return G.GetNI(NId).GetDeg()
+
 def get_common_neighbors(G, ANId, BNId):
     ANbr = get_nbr_set(G, ANId)
     BNbr = get_nbr_set(G, BNId)
@@ -107,7 +460,7 @@ def PMI(IRG, AIId, BIId, NR, Threshold=0):
     CommonNeighbors, ANbr, BNbr = get_common_neighbors(IRG, AIId, BIId)
     NumInCommon = len(CommonNeighbors)
     if NumInCommon >= Threshold:
-        return True, np.log(NumInCommon) - np.log(len(ANbr)) - np.log(len(BNbr)) + np.log(NR)
+        return True, np.log(NumInCommon) - np.log(get_degree(IRG, AIId)) - np.log(get_degree(IRG, BIId)) + np.log(NR)
     else:
         return False, float('-inf')
 
@@ -115,7 +468,7 @@ def PMI(IRG, AIId, BIId, NR, Threshold=0):
 def JI(G, ANId, BNId, Threshold=0):
     CommonNeighbors, ANbr, BNbr = get_common_neighbors(G, ANId, BNId)
     NUMER = len(CommonNeighbors)
-    DENOM = len(ANbr.union(BNbr))
+    DENOM = get_degree(G, ANId) + get_degree(G, BNId) - NUMER
     return  float(NUMER) / DENOM if NUMER >= Threshold else 0
 
 # Compute the Food Pairing Hypothesis Factor for two Ingredients A and B
@@ -136,15 +489,59 @@ def SF(IFG, IRG, AIId, BIId, FlavorThreshold=0):
     Score = FF / (1 + RF)
     return Score > 0, Score
 
+##############################################
+############### Flavor Bitsets ###############
+##############################################
+
+# Number of set bits in every possible byte
+BytePopCount = np.array([bin(Byte).count('1') for Byte in range(256)], dtype=np.uint8)
+
+# Pack the flavors of each ingredient in IIds into a row of bits (one bit per flavor, 8 flavors per byte)
+def flavor_bitsets(IFG, IIds):
+    NbrSets = [get_nbr_set(IFG, IId) for IId in IIds]
+    FIds = {FId:i for i, FId in enumerate(sorted(set().union(*NbrSets)))}
+    Bits = np.zeros((len(IIds), max(len(FIds), 1)), dtype=bool)
+    for Row, Nbrs in enumerate(NbrSets):
+        Bits[Row, [FIds[FId] for FId in Nbrs]] = True
+    return np.packbits(Bits, axis=1)
+
+# Flavor factor statistics over all pairs of a set of ingredients
+FlavorFactorStats = collections.namedtuple('FlavorFactorStats', ['MedFF', 'MeanFF', 'StdFF', 'MeanCommonFlavors'])
+
+# Compute MedFF, MeanFF, StdFF and MeanCommonFlavors of IIds in a single sweep over their flavor bitsets,
+# one (BlockSize x BlockSize) tile of pairs at a time (intersections and unions become popcounts)
+def flavor_factor_stats(IFG, IIds, BlockSize=128):
+    Bits = flavor_bitsets(IFG, IIds)
+    Counts = BytePopCount[Bits].sum(1, dtype=np.int64)
+    N = len(IIds)
+    NumPairs = N * (N - 1) // 2
+    if NumPairs == 0: raise ValueError('Flavor factors need at least two ingredients')
+    Min, Max, Sum, SumSq, CommonSum = float('inf'), float('-inf'), 0.0, 0.0, 0
+    for RStart in range(0, N - 1, BlockSize):
+        RStop = min(RStart + BlockSize, N)
+        for CStart in range(RStart, N, BlockSize):
+            CStop = min(CStart + BlockSize, N)
+            Common = BytePopCount[Bits[RStart:RStop, None, :] & Bits[None, CStart:CStop, :]].sum(2, dtype=np.int64)
+            Union = Counts[RStart:RStop, None] + Counts[None, CStart:CStop] - Common
+            FFs = np.where(Union > 0, Common / np.maximum(Union, 1).astype(np.float64), 0.0)
+            # Only keep pairs (i, j) with i < j
+            Upper = np.arange(CStart, CStop)[None, :] > np.arange(RStart, RStop)[:, None]
+            FFs, Common = FFs[Upper], Common[Upper]
+            if len(FFs) == 0: continue
+            Min, Max = min(Min, FFs.min()), max(Max, FFs.max())
+            Sum, SumSq, CommonSum = Sum + FFs.sum(), SumSq + (FFs ** 2).sum(), CommonSum + Common.sum()
+    Mean = Sum / NumPairs
+    Std = np.sqrt(max(SumSq / NumPairs - Mean ** 2, 0.0))
+    return FlavorFactorStats((Min + Max) / 2, Mean, Std, float(CommonSum) / NumPairs)
+
 def MedFF(IFG, IIds):
-    FFs = [JI(IFG, AIId, BIId) for i, AIId in enumerate(IIds[:-1]) for BIId in IIds[i+1:]]
-    return (min(FFs) + max(FFs)) / 2
+    return flavor_factor_stats(IFG, IIds).MedFF
 
 def MeanFF(IFG, IIds):
-    return np.mean([JI(IFG, AIId, BIId) for i, AIId in enumerate(IIds[:-1]) for BIId in IIds[i+1:]])
+    return flavor_factor_stats(IFG, IIds).MeanFF
 
 def StdFF(IFG, IIds):
-    return np.std([JI(IFG, AIId, BIId) for i, AIId in enumerate(IIds[:-1]) for BIId in IIds[i+1:]])
+    return flavor_factor_stats(IFG, IIds).StdFF
 
 def MeanCommonFlavors(IFG, IIds):
-    return np.mean([len(get_common_neighbors(IFG, AIId, BIId)[0]) for i, AIId in enumerate(IIds[:-1]) for BIId in IIds[i+1:]])
+    return flavor_factor_stats(IFG, IIds).MeanCommonFlavors
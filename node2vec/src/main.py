@@ -10,6 +10,8 @@ Knowledge Discovery and Data Mining (KDD), 2016
 '''
 
 import argparse
+import os
+import tempfile
 import numpy as np
 import networkx as nx
 import node2vec
@@ -22,7 +24,7 @@ def parse_args():
 	parser = argparse.ArgumentParser(description="Run node2vec.")
 
 	parser.add_argument('--input', nargs='?', default='graph/karate.edgelist',
-	                    help='Input graph path')
+	                    help='Input graph path (a text edgelist, or binary edge arrays ending in .npz)')
 
 	parser.add_argument('--output', nargs='?', default='emb/karate.emb',
 	                    help='Embeddings path')
@@ -45,6 +47,12 @@ def parse_args():
 	parser.add_argument('--workers', type=int, default=8,
 	                    help='Number of parallel workers. Default is 8.')
 
+	parser.add_argument('--walks', nargs='?', default=None,
+	                    help='Path of the int32 .npy file the walks are written to and streamed from. Default is a temporary file.')
+
+	parser.add_argument('--seed', type=int, default=None,
+	                    help='Seed of the random walks. Default is a random seed.')
+
 	parser.add_argument('--p', type=float, default=1,
 	                    help='Return hyperparameter. Default is 1.')
 
@@ -56,6 +64,10 @@ def parse_args():
 	parser.add_argument('--unweighted', dest='unweighted', action='store_false')
 	parser.set_defaults(weighted=False)
 
+	parser.add_argument('--rejection-sampling', dest='rejection_sampling', action='store_true',
+	                    help='Apply the p/q bias at draw time by rejection sampling instead of precomputing an alias table for every edge. Default is alias tables.')
+	parser.set_defaults(rejection_sampling=False)
+
 	parser.add_argument('--directed', dest='directed', action='store_true',
 	                    help='Graph is (un)directed. Default is undirected.')
 	parser.add_argument('--undirected', dest='undirected', action='store_false')
@@ -79,11 +91,23 @@ def read_graph():
 
 	return G
 
+def read_csr_graph():
+	'''
+	Reads the input network as a CSR graph, straight from binary edge arrays (an .npz file
+	with Src, Dst and Weights arrays, as written by the network builders) or through networkx.
+	'''
+	if not args.input.endswith('.npz'):
+		return node2vec.CSRGraph(read_graph(), args.directed, args.p, args.q, args.rejection_sampling)
+	with np.load(args.input) as f:
+		src, dst = f['Src'], f['Dst']
+		weights = f['Weights'] if args.weighted else np.ones(len(src))
+
+	return node2vec.CSRGraph.from_edges(src, dst, weights, args.directed, args.p, args.q, args.rejection_sampling)
+
 def learn_embeddings(walks):
 	'''
 	Learn embeddings by optimizing the Skipgram objective using SGD.
 	'''
-	walks = [map(str, walk) for walk in walks]
 	model = Word2Vec(walks, size=args.dimensions, window=args.window_size, min_count=0, sg=1, workers=args.workers, iter=args.iter)
 	model.save_word2vec_format(args.output)
 	
@@ -93,11 +117,18 @@ def main(args):
 	'''
 	Pipeline for representational learning for all nodes in a graph.
 	'''
-	nx_G = read_graph()
-	G = node2vec.Graph(nx_G, args.directed, args.p, args.q)
+	G = read_csr_graph()
 	G.preprocess_transition_probs()
-	walks = G.simulate_walks(args.num_walks, args.walk_length)
-	learn_embeddings(walks)
+	walks_file = args.walks
+	if walks_file is None:
+		fd, walks_file = tempfile.mkstemp(suffix='.npy')
+		os.close(fd)
+	try:
+		walks = G.write_walks(walks_file, args.num_walks, args.walk_length, args.workers, args.seed)
+		learn_embeddings(walks)
+	finally:
+		if args.walks is None and os.path.exists(walks_file):
+			os.remove(walks_file)
 
 if __name__ == "__main__":
 	args = parse_args()
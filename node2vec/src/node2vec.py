@@ -1,6 +1,8 @@
 import numpy as np
 import networkx as nx
 import random
+import itertools
+import multiprocessing
 
 
 class Graph():
@@ -104,6 +106,293 @@ class Graph():
 		return
 
 
+class CSRGraph():
+	def __init__(self, nx_G, is_directed, p, q, rejection_sampling=False):
+		'''
+		Store the graph as a CSR adjacency over node indices: the neighbors of nodes[i] are
+		nbrs[offsets[i]:offsets[i+1]], sorted by node id, with weights in the same positions.
+		With rejection_sampling, no per-edge alias tables are built and the p/q bias is
+		applied at draw time instead (O(E) rather than O(sum of squared degrees) memory).
+		'''
+		self.is_directed = is_directed
+		self.p = p
+		self.q = q
+		self.rejection_sampling = rejection_sampling
+
+		edges = [(src, dst, data['weight']) for src, dst, data in nx_G.edges(data=True)]
+		srcs, dsts, weights = [np.array(column) for column in zip(*edges)] if edges else [np.zeros(0)] * 3
+		self.set_edges(sorted(nx_G.nodes()), srcs, dsts, weights)
+
+	@classmethod
+	def from_edges(cls, srcs, dsts, weights, is_directed, p, q, rejection_sampling=False, nodes=None):
+		'''
+		Build the graph straight from arrays of edges (each undirected edge given once) instead of
+		a networkx graph. The nodes are the endpoints of the edges unless nodes is given.
+		'''
+		graph = cls(nx.Graph(), is_directed, p, q, rejection_sampling)
+		if nodes is None:
+			nodes = np.union1d(srcs, dsts)
+		graph.set_edges(nodes, srcs, dsts, weights)
+		return graph
+
+	def set_edges(self, nodes, srcs, dsts, weights):
+		'''
+		Build the CSR adjacency of the nodes from edge arrays (both directions of undirected edges).
+		'''
+		self.nodes = np.array(sorted(nodes), dtype=np.int32)
+		srcs = np.searchsorted(self.nodes, np.asarray(srcs, dtype=np.int64))
+		dsts = np.searchsorted(self.nodes, np.asarray(dsts, dtype=np.int64))
+		weights = np.asarray(weights, dtype=np.float64)
+		if not self.is_directed:
+			loops = srcs == dsts
+			srcs, dsts = np.concatenate([srcs, dsts[~loops]]), np.concatenate([dsts, srcs[~loops]])
+			weights = np.concatenate([weights, weights[~loops]])
+		order = np.lexsort((dsts, srcs))
+		self.degrees = np.bincount(srcs, minlength=len(self.nodes)).astype(np.int64)
+		self.offsets = np.concatenate([[0], np.cumsum(self.degrees)]).astype(np.int64)
+		self.nbrs = dsts[order].astype(np.int32)
+		self.weights = weights[order]
+		self.srcs = srcs[order].astype(np.int32)
+		self.edge_keys = self.srcs.astype(np.int64) * len(self.nodes) + self.nbrs
+
+	def has_edges(self, srcs, dsts):
+		'''
+		Whether each (src, dst) pair of node indices is an edge (rows are sorted, so edge keys are too).
+		'''
+		keys = self.edge_keys
+		query = np.asarray(srcs, dtype=np.int64) * len(self.nodes) + dsts
+		if len(keys) == 0:
+			return np.zeros(len(query), dtype=bool)
+		index = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+		return keys[index] == query
+
+	def preprocess_transition_probs(self):
+		'''
+		Build flat alias tables: the table of node i is at [offsets[i], offsets[i+1]) of
+		node_J/node_q, and the table of the edge at offset e (src -> dst) is at
+		[edge_offsets[e], edge_offsets[e+1]) of edge_J/edge_q, over the neighbors of dst.
+		'''
+		offsets, weights = self.offsets, self.weights
+		self.node_J, self.node_q = flat_alias_setup(weights, offsets)
+		if self.rejection_sampling:
+			return
+
+		# Every (src -> dst -> dst_nbr) triple, with the p/q bias of Graph.get_alias_edge
+		edge_degrees = self.degrees[self.nbrs]
+		self.edge_offsets = np.concatenate([[0], np.cumsum(edge_degrees)]).astype(np.int64)
+		srcs = np.repeat(self.srcs, edge_degrees)
+		dsts = np.repeat(self.nbrs, edge_degrees)
+		positions = self.offsets[dsts] + np.arange(self.edge_offsets[-1]) - np.repeat(self.edge_offsets[:-1], edge_degrees)
+		dst_nbrs = self.nbrs[positions]
+		unnormalized_probs = weights[positions] / self.q
+		unnormalized_probs = np.where(self.has_edges(dst_nbrs, srcs), weights[positions], unnormalized_probs)
+		unnormalized_probs = np.where(dst_nbrs == srcs, weights[positions] / self.p, unnormalized_probs)
+		self.edge_J, self.edge_q = flat_alias_setup(unnormalized_probs, self.edge_offsets)
+
+		return
+
+	def simulate_walks(self, num_walks, walk_length, workers=1, seed=None, shard_size=1024):
+		'''
+		Repeatedly simulate random walks from each node. Every walk iteration visits the nodes in
+		a shuffled order that is split into shards of shard_size start nodes, and the shards are
+		simulated on a pool of worker processes. The RNG of each shard is seeded from
+		(seed, walk iteration, shard), so the walks only depend on the seed and not on the
+		number of workers. Returns an int32 (num_walks * num_nodes, walk_length) matrix of
+		node ids, where walks that reach a node without neighbors are padded with -1.
+		'''
+		walks = list(self.iter_walks(num_walks, walk_length, workers, seed, shard_size))
+
+		return np.concatenate(walks) if walks else np.zeros((0, walk_length), dtype=np.int32)
+
+	def write_walks(self, filename, num_walks, walk_length, workers=1, seed=None, shard_size=1024):
+		'''
+		Simulate the same walks as simulate_walks, writing each shard to an int32 .npy file as it
+		is simulated so that the walks are never all held in memory. Returns a WalkCorpus of the file.
+		'''
+		header = {'descr': np.lib.format.dtype_to_descr(np.dtype(np.int32)), 'fortran_order': False,
+			'shape': (num_walks * len(self.nodes), walk_length)}
+		with open(filename, 'wb') as f:
+			np.lib.format.write_array_header_1_0(f, header)
+			for shard_walks in self.iter_walks(num_walks, walk_length, workers, seed, shard_size):
+				shard_walks.astype(np.int32).tofile(f)
+
+		return WalkCorpus(filename)
+
+	def iter_walks(self, num_walks, walk_length, workers=1, seed=None, shard_size=1024):
+		'''
+		Generate the walk matrix of every shard in order (see simulate_walks).
+		'''
+		if seed is None:
+			seed = np.random.randint(2**31 - 1)
+		num_shards = num_walks * ((len(self.nodes) + shard_size - 1) // shard_size)
+		print 'Simulating {} walk iterations in {} shards on {} workers'.format(num_walks, num_shards, workers)
+		shards = iter_shards(len(self.nodes), num_walks, seed, shard_size)
+
+		global _walk_state
+		_walk_state = (self, walk_length)
+		try:
+			if workers == 1:
+				for shard in shards:
+					yield simulate_shard(shard)
+			else:
+				pool = multiprocessing.Pool(workers)
+				try:
+					# The pool queues up every task it is given straight away, so it is given
+					# a few shards per worker at a time
+					while True:
+						window = list(itertools.islice(shards, 4 * workers))
+						if not window:
+							break
+						for shard_walks in pool.imap(simulate_shard, window):
+							yield shard_walks
+				finally:
+					pool.close()
+					pool.join()
+		finally:
+			_walk_state = None
+
+	def node2vec_walks(self, walk_length, start_nodes, rng=np.random):
+		'''
+		Simulate random walks from an array of start node indices, advancing all walkers in lock-step.
+		'''
+		walks = np.full((len(start_nodes), walk_length), -1, dtype=np.int32)
+		if walk_length == 0:
+			return walks
+		walks[:, 0] = start_nodes
+		# Walkers that can still move, and the offset of the edge each one arrived by
+		active = np.arange(len(start_nodes))
+		cur = start_nodes.astype(np.int64)
+		edges = None
+		for step in range(1, walk_length):
+			keep = self.degrees[cur] > 0
+			active, cur = active[keep], cur[keep]
+			if len(active) == 0:
+				break
+			if edges is None:
+				k = flat_alias_draw(self.node_J, self.node_q, self.offsets[cur], self.degrees[cur], rng)
+			else:
+				edges = edges[keep]
+				if self.rejection_sampling:
+					k = self.rejection_draw(self.srcs[edges], cur, rng)
+				else:
+					k = flat_alias_draw(self.edge_J, self.edge_q, self.edge_offsets[edges], self.degrees[cur], rng)
+			edges = self.offsets[cur] + k
+			cur = self.nbrs[edges].astype(np.int64)
+			walks[active, step] = cur
+
+		# Map node indices back to node ids
+		walks[walks >= 0] = self.nodes[walks[walks >= 0]]
+		return walks
+
+	def rejection_draw(self, prev, cur, rng=np.random):
+		'''
+		Draw the next neighbor (relative to the start of its row) of walkers at cur that arrived
+		from prev: propose from the first-order alias table of cur and accept with probability
+		bias / max bias, where bias is 1/p to return to prev, 1 for neighbors of prev and 1/q
+		otherwise. Accepted draws follow the same distribution as the per-edge alias tables.
+		'''
+		max_bias = max(1.0 / self.p, 1.0, 1.0 / self.q)
+		k = np.zeros(len(cur), dtype=np.int64)
+		pending = np.arange(len(cur))
+		while len(pending) > 0:
+			starts = self.offsets[cur[pending]]
+			proposals = flat_alias_draw(self.node_J, self.node_q, starts, self.degrees[cur[pending]], rng)
+			nbrs = self.nbrs[starts + proposals]
+			bias = np.where(self.has_edges(nbrs, prev[pending]), 1.0, 1.0 / self.q)
+			bias = np.where(nbrs == prev[pending], 1.0 / self.p, bias)
+			accept = rng.rand(len(pending)) * max_bias < bias
+			k[pending[accept]] = proposals[accept]
+			pending = pending[~accept]
+
+		return k
+
+
+def iter_shards(num_nodes, num_walks, seed, shard_size):
+	'''
+	Generate the (key, start nodes) of every shard in order, one walk iteration at a time, so that
+	the start node permutations are never all held in memory.
+	'''
+	for walk_iter in range(num_walks):
+		start_nodes = np.random.RandomState([seed, walk_iter]).permutation(num_nodes).astype(np.int32)
+		for shard, start in enumerate(range(0, num_nodes, shard_size)):
+			yield (seed, walk_iter, shard), start_nodes[start:start+shard_size]
+
+# Graph and walk length shared with the walk worker processes. They are set before the pool is
+# created and inherited by the forked workers, so the graph and alias tables are never pickled.
+_walk_state = None
+
+def simulate_shard(shard):
+	'''
+	Simulate the walks of one shard of start nodes with the shard's own seeded RNG.
+	'''
+	G, walk_length = _walk_state
+	seed, start_nodes = shard
+	return G.node2vec_walks(walk_length, start_nodes, np.random.RandomState(list(seed)))
+
+class WalkCorpus():
+	def __init__(self, filename, chunk_size=10000):
+		'''
+		Walks saved by CSRGraph.write_walks, read back chunk_size walks at a time each time the
+		corpus is iterated, as lists of node id strings (the sentences Word2Vec trains on).
+		'''
+		self.filename = filename
+		self.chunk_size = chunk_size
+
+	def __iter__(self):
+		with open(self.filename, 'rb') as f:
+			shape, dtype = read_npy_header(f)
+			for start in range(0, shape[0], self.chunk_size):
+				rows = min(self.chunk_size, shape[0] - start)
+				walks = np.fromfile(f, dtype=dtype, count=rows * shape[1]).reshape(rows, shape[1])
+				for walk in walk_lists(walks):
+					yield map(str, walk)
+
+	def __len__(self):
+		with open(self.filename, 'rb') as f:
+			return read_npy_header(f)[0][0]
+
+def read_npy_header(f):
+	'''
+	Read the header of a .npy file, leaving f at the start of its data. Returns (shape, dtype).
+	'''
+	version = np.lib.format.read_magic(f)
+	if version == (1, 0):
+		shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+	else:
+		shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+	return shape, dtype
+
+def walk_lists(walks):
+	'''
+	Convert a walk matrix into lists of node ids without the -1 padding.
+	'''
+	return [[node for node in walk if node >= 0] for walk in walks.tolist()]
+
+def flat_alias_setup(probs, offsets):
+	'''
+	Alias tables of the (unnormalized) distributions probs[offsets[i]:offsets[i+1]], stored
+	in flat arrays where J holds indices relative to the start of each distribution.
+	'''
+	J = np.zeros(len(probs), dtype=np.int32)
+	q = np.zeros(len(probs))
+	for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+		if end == start:
+			continue
+		segment = probs[start:end]
+		J[start:end], q[start:end] = alias_setup(segment / segment.sum())
+
+	return J, q
+
+def flat_alias_draw(J, q, starts, sizes, rng=np.random):
+	'''
+	Draw one sample from each of the flat alias tables starting at starts with sizes entries.
+	'''
+	kk = np.floor(rng.rand(len(starts)) * sizes).astype(np.int64)
+	accept = rng.rand(len(starts)) < q[starts + kk]
+
+	return np.where(accept, kk, J[starts + kk])
+
 def alias_setup(probs):
 	'''
 	Compute utility lists for non-uniform sampling from discrete distributions.